@@ -1,72 +1,168 @@
 import pandas as pd
-import matplotlib.pyplot as plt
+import numpy as np
 import os
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-import plotly.express as px
+from io import BytesIO
+from compact_table import CompactTable
+# matplotlib and plotly are imported inside the chart functions so headless jobs only load pandas/NumPy
 
 # ABC Analysis
 def abc_analysis(df):
-    sales_per_product = df.groupby("item")["price"].sum().sort_values(ascending=False)
+    if isinstance(df, CompactTable):
+        return classify_abc(df.item_revenue())
+    # Accumulate in float64 so narrower price columns don't lose precision in the totals
+    prices = df["price"].astype("float64")
+    return classify_abc(prices.groupby(df["item"], observed=True).sum())
+
+# ABC classes from total revenue per item
+def classify_abc(item_revenue):
+    sales_per_product = item_revenue.rename("price").rename_axis("item").sort_values(ascending=False)
     total_sales = sales_per_product.sum()
-    sales_cumulative = (sales_per_product / total_sales).cumsum()
+    # Rounding can push the last cumulative share just past 1, which pd.cut would leave unclassified
+    sales_cumulative = (sales_per_product / total_sales).cumsum().clip(upper=1)
     abc_categories = pd.cut(sales_cumulative, bins=[0, 0.8, 0.95, 1], labels=["A", "B", "C"])
     sales_per_product = sales_per_product.reset_index()
     sales_per_product["ABC"] = abc_categories.values
     return sales_per_product
 
 # FRM Analysis
-def frm_analysis(df):
-    df["date"] = pd.to_datetime(df["date"])
-    current_date = df["date"].max() + pd.Timedelta(days=1)
-    frm = df.groupby("customer").agg(
+# Segment labels in priority order; used as the categorical dtype of "Segment"
+FRM_SEGMENTS = ["High Value", "Loyal", "At Risk", "Low Value"]
+
+# clusters: optional FRMClusterModel (frm_clustering); when given, a k-means "Cluster" column is added
+def frm_analysis(df, clusters=None):
+    if isinstance(df, CompactTable):
+        return frm_from_aggregates(df.customer_aggregates(), clusters=clusters)
+    # Parse into a local series so the caller's frame is left untouched
+    dates = pd.to_datetime(df["date"])
+    grouped = df[["key"]].assign(date=dates, price=df["price"].astype("float64")).groupby(df["customer"], observed=True).agg(
         Frequency=("key", "count"),
-        Recency=("date", lambda x: (current_date - x.max()).days),
+        LastDate=("date", "max"),
         Monetary=("price", "sum"),)
-    # Add thresholds for segmentation
-    recency_threshold = frm["Recency"].astype(int).median()
-    frequency_threshold = frm["Frequency"].median()
-    monetary_threshold = frm["Monetary"].median()
-    # Create segments
-    frm['Segment'] = (frm.apply(lambda row: 'High Value' if row['Frequency'] > frequency_threshold and row['Monetary'] > monetary_threshold
-                          else ('Loyal' if row['Frequency'] > frequency_threshold 
-                                else ('At Risk' if row['Recency'] > recency_threshold else 'Low Value')), axis=1))
+    return frm_from_aggregates(grouped, clusters=clusters)
+
+# FRM table from per-customer Frequency, LastDate and Monetary aggregates
+def frm_from_aggregates(customers, current_date=None, clusters=None):
+    if current_date is None:
+        current_date = customers["LastDate"].max() + pd.Timedelta(days=1)
+    frm = pd.DataFrame({
+        "Frequency": customers["Frequency"].astype("int32"),
+        "Recency": (current_date - customers["LastDate"]).dt.days.astype("int32"),
+        "Monetary": customers["Monetary"],})
+    frm["Segment"] = assign_frm_segments(frm)
+    if clusters is not None:
+        frm["Cluster"] = clusters.fit_predict(frm)
     return frm
 
+# Exact median thresholds; sketches.FRMSketch gives mergeable approximations of the same values
+def frm_thresholds(frm):
+    return {axis: frm[axis].median() for axis in ["Recency", "Frequency", "Monetary"]}
+
+# Vectorized segment assignment from the median thresholds (exact unless thresholds are given)
+def assign_frm_segments(frm, thresholds=None):
+    if thresholds is None:
+        thresholds = frm_thresholds(frm)
+    recency_threshold = thresholds["Recency"]
+    frequency_threshold = thresholds["Frequency"]
+    monetary_threshold = thresholds["Monetary"]
+    frequent = frm["Frequency"].to_numpy() > frequency_threshold
+    conditions = [frequent & (frm["Monetary"].to_numpy() > monetary_threshold),
+                  frequent,
+                  frm["Recency"].to_numpy() > recency_threshold]
+    codes = np.select(conditions, [0, 1, 2], default=3).astype("int8")
+    return pd.Categorical.from_codes(codes, categories=FRM_SEGMENTS)
+
+# Save a chart to output_path, or return its encoded bytes when no path is given
+def _export_figure(fig, output_path=None, fmt="png"):
+    if output_path:
+        fig.savefig(output_path)
+        return output_path
+    buffer = BytesIO()
+    fig.savefig(buffer, format=fmt)
+    return buffer.getvalue()
+
 # Visualize ABC Analysis
-def visualize_abc(abc_results, output_path):
-    plt.figure(figsize=(5, 4))
-    abc_results.groupby("ABC")["price"].sum().plot(kind="bar", color=["green", "orange", "red"])
-    plt.title("ABC Analysis", color="blue")
-    plt.xlabel("Category")
-    plt.xticks(rotation=0)
-    plt.ylabel("Total Sales")
-    plt.yticks(size=6)
-    plt.grid(alpha=0.1)
-    plt.savefig(output_path)
-    plt.close()
+# Charts use a standalone Figure rather than pyplot's global state so concurrent sessions can render safely
+def visualize_abc(abc_results, output_path=None, fmt="png"):
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(5, 4))
+    ax = fig.subplots()
+    abc_results.groupby("ABC")["price"].sum().plot(kind="bar", color=["green", "orange", "red"], ax=ax)
+    ax.set_title("ABC Analysis", color="blue")
+    ax.set_xlabel("Category")
+    ax.tick_params(axis="x", rotation=0)
+    ax.set_ylabel("Total Sales")
+    ax.tick_params(axis="y", labelsize=6)
+    ax.grid(alpha=0.1)
+    return _export_figure(fig, output_path, fmt)
 
 # Visualize FRM Analysis
-def visualize_frm(frm_results, output_path):
-    plt.figure(figsize=(5, 4))
-    frm_results["Segment"].value_counts().plot(kind="bar", color=['#3498db', '#2ecc71', '#f1c40f', '#e74c3c'])
-    plt.title("Customer Segmentation (FRM)", color="blue")
-    plt.xlabel("Segment")
-    plt.xticks(rotation=0)
-    plt.ylabel("Number of Customers")
-    plt.grid(alpha=0.1)
-    plt.savefig(output_path)
-    plt.close()
+def visualize_frm(frm_results, output_path=None, fmt="png"):
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(5, 4))
+    ax = fig.subplots()
+    frm_results["Segment"].value_counts().plot(kind="bar", color=['#3498db', '#2ecc71', '#f1c40f', '#e74c3c'], ax=ax)
+    ax.set_title("Customer Segmentation (FRM)", color="blue")
+    ax.set_xlabel("Segment")
+    ax.tick_params(axis="x", rotation=0)
+    ax.set_ylabel("Number of Customers")
+    ax.grid(alpha=0.1)
+    return _export_figure(fig, output_path, fmt)
     
 # Interactive 3D FRM Plot ="frm_3d_plot_with_segments.html"
-# Function for 3D FRM Plot with Segments
-def frm_3d_scatter_with_segments(frm_results):
-    if "Segment" not in frm_results.columns:
-        st.error("The FRM data must contain a 'Segment' column for visualization.")
-        return None
-    # Create the 3D scatter plot
-    fig = px.scatter_3d(frm_results.reset_index(),x="Recency", y="Frequency", z="Monetary", color="Segment", symbol="Segment", hover_name="customer",
-         color_discrete_map={"High Value": "#2ecc71", "Loyal": "#3498db", "At Risk": "#e74c3c", "Low Value": "#f1c40f"})
-    fig.update_traces(marker=dict(size=3, opacity=0.5))
+FRM_COLORS = {"High Value": "#2ecc71", "Loyal": "#3498db", "At Risk": "#e74c3c", "Low Value": "#f1c40f"}
+FRM_AXES = ["Recency", "Frequency", "Monetary"]
+
+# Stratified sample of at most max_points customers: each segment (or other group column) keeps its
+# share of the budget, and the customers at the extremes of every FRM axis are always included
+def sample_frm_by_segment(frm_results, max_points=5000, seed=0, by="Segment"):
+    if len(frm_results) <= max_points:
+        return frm_results
+    rng = np.random.default_rng(seed)
+    positions = np.arange(len(frm_results))
+    segments = frm_results[by].to_numpy()
+    keep = []
+    for segment in pd.unique(segments):
+        members = positions[segments == segment]
+        quota = max(1, int(max_points * len(members) / len(frm_results)))
+        extremes = set()
+        for axis in FRM_AXES:
+            values = frm_results[axis].to_numpy()[members]
+            extremes.update([members[values.argmin()], members[values.argmax()]])
+        extremes = np.fromiter(extremes, dtype=members.dtype)
+        rest = np.setdiff1d(members, extremes, assume_unique=True)
+        fill = max(0, quota - len(extremes))
+        keep.extend([extremes, rng.choice(rest, size=min(fill, len(rest)), replace=False)])
+    return frm_results.iloc[np.sort(np.concatenate(keep))]
+
+# Customer counts per Segment (or other group column) in a bins x bins x bins grid over the FRM space, placed at the cell centres
+def frm_density_bins(frm_results, bins=12, by="Segment"):
+    cells = {}
+    for axis in FRM_AXES:
+        values = frm_results[axis].to_numpy(dtype="float64")
+        edges = np.linspace(values.min(), values.max(), bins + 1)
+        codes = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, bins - 1)
+        cells[axis] = ((edges[:-1] + edges[1:]) / 2)[codes]
+    cells[by] = frm_results[by].to_numpy()
+    density = pd.DataFrame(cells).groupby(FRM_AXES + [by], observed=True).size()
+    return density.rename("Customers").reset_index()
+
+# Function for 3D FRM Plot with Segments; mode "sample" plots a stratified sample of customers,
+# mode "density" plots binned customer counts so the payload no longer grows with the customer base;
+# color="Cluster" colours by the k-means clusters from frm_analysis(df, clusters=...) instead of the rule segments
+def frm_3d_scatter_with_segments(frm_results, max_points=5000, mode="sample", bins=12, color="Segment"):
+    if color not in frm_results.columns:
+        raise ValueError(f"The FRM data must contain a '{color}' column for visualization.")
+    import plotly.express as px
+    colors = FRM_COLORS if color == "Segment" else None
+    if mode == "density":
+        density = frm_density_bins(frm_results, bins, by=color)
+        fig = px.scatter_3d(density, x="Recency", y="Frequency", z="Monetary", color=color, size="Customers",
+             hover_data={"Customers": True}, color_discrete_map=colors)
+        fig.update_traces(marker=dict(opacity=0.6, line=dict(width=0)))
+    else:
+        sample = sample_frm_by_segment(frm_results, max_points, by=color)
+        fig = px.scatter_3d(sample.reset_index(),x="Recency", y="Frequency", z="Monetary", color=color, symbol=color, hover_name="customer",
+             color_discrete_map=colors)
+        fig.update_traces(marker=dict(size=3, opacity=0.5))
     fig.update_layout(scene=dict(xaxis_title="Recency (Days)", yaxis_title="Frequency", zaxis_title="Monetary ($)"))
     return fig
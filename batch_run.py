@@ -0,0 +1,74 @@
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from chunked_analysis import PartialAggregates, aggregate_csv
+
+# Headless ABC/FRM runs over many store CSVs. Only pandas/NumPy are imported unless --charts is given.
+
+def store_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+def write_results(partial, output_dir, charts=False):
+    os.makedirs(output_dir, exist_ok=True)
+    abc_results = partial.abc()
+    frm_results = partial.frm()
+    abc_results.to_csv(os.path.join(output_dir, "abc_results.csv"), index=False)
+    frm_results.to_csv(os.path.join(output_dir, "frm_results.csv"))
+    if charts:
+        from analysis_tools import visualize_abc, visualize_frm
+        visualize_abc(abc_results, os.path.join(output_dir, "abc_chart.png"))
+        visualize_frm(frm_results, os.path.join(output_dir, "frm_chart.png"))
+    return abc_results, frm_results
+
+# Worker: aggregate one store, write its results and hand the small partial aggregates back for consolidation
+def run_store(path, output_dir, chunksize, charts):
+    partial = aggregate_csv(path, chunksize)
+    write_results(partial, os.path.join(output_dir, "stores", store_name(path)), charts)
+    return partial
+
+def expand_paths(patterns):
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        paths.extend(matches or [pattern])
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Run ABC and FRM analysis for many store CSVs in parallel.")
+    parser.add_argument("csvs", nargs="+", help="Store CSV files or glob patterns, e.g. 'exports/*.csv'")
+    parser.add_argument("--output-dir", default="output")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunksize", type=int, default=1_000_000, help="Rows read per chunk within a store")
+    parser.add_argument("--charts", action="store_true", help="Also render abc_chart.png and frm_chart.png")
+    args = parser.parse_args()
+
+    paths = expand_paths(args.csvs)
+    names = [store_name(path) for path in paths]
+    if len(set(names)) != len(names):
+        parser.error("store CSVs must have distinct file names")
+
+    start = time.perf_counter()
+    partials = []
+    failed = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(run_store, path, args.output_dir, args.chunksize, args.charts): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                partials.append(future.result())
+            except Exception as exc:
+                failed.append(path)
+                print(f"{store_name(path)}: failed: {exc}", file=sys.stderr)
+
+    # Consolidated results treat all stores as one business: revenue and customers are merged across stores
+    if partials:
+        write_results(PartialAggregates.combine(partials), args.output_dir, args.charts)
+    print(f"Processed {len(partials)} of {len(paths)} stores in {time.perf_counter() - start:.1f}s")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
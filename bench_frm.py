@@ -0,0 +1,46 @@
+import argparse
+import time
+import pandas as pd
+from analysis_tools import frm_analysis
+from synthetic_data import generate_transactions
+
+# Row-wise FRM implementation kept for comparison against the vectorized engine
+def legacy_frm_analysis(df):
+    df["date"] = pd.to_datetime(df["date"])
+    current_date = df["date"].max() + pd.Timedelta(days=1)
+    frm = df.groupby("customer").agg(
+        Frequency=("key", "count"),
+        Recency=("date", lambda x: (current_date - x.max()).days),
+        Monetary=("price", "sum"),)
+    recency_threshold = frm["Recency"].astype(int).median()
+    frequency_threshold = frm["Frequency"].median()
+    monetary_threshold = frm["Monetary"].median()
+    frm['Segment'] = (frm.apply(lambda row: 'High Value' if row['Frequency'] > frequency_threshold and row['Monetary'] > monetary_threshold
+                          else ('Loyal' if row['Frequency'] > frequency_threshold
+                                else ('At Risk' if row['Recency'] > recency_threshold else 'Low Value')), axis=1))
+    return frm
+
+def time_call(func, df):
+    start = time.perf_counter()
+    result = func(df)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the vectorized FRM engine with the row-wise implementation.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument("--skip-legacy", action="store_true", help="Only time the vectorized engine")
+    args = parser.parse_args()
+
+    print(f"{'rows':>12} {'legacy (s)':>12} {'vectorized (s)':>15} {'speedup':>9}")
+    for n_rows in args.rows:
+        df = generate_transactions(n_rows)
+        new_time, new = time_call(frm_analysis, df)
+        if args.skip_legacy:
+            print(f"{n_rows:>12,} {'-':>12} {new_time:>15.3f} {'-':>9}")
+            continue
+        old_time, old = time_call(legacy_frm_analysis, df.copy())
+        assert (new["Segment"].astype(str) == old["Segment"]).all(), "segment mismatch"
+        print(f"{n_rows:>12,} {old_time:>12.3f} {new_time:>15.3f} {old_time / new_time:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
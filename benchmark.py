@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from analysis_tools import abc_analysis, frm_analysis, visualize_abc, visualize_frm
+from compact_table import LabelDictionary
+from dataset_cache import parse_dataset
+from insights_cube import InsightsCube
+from synthetic_data import write_transactions_csv
+
+# Run func once for wall time and once under tracemalloc for peak allocated memory
+def measure(func, track_memory=True):
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    peak_mb = None
+    if track_memory:
+        tracemalloc.start()
+        func()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return result, seconds, peak_mb
+
+def insights_rollups(cube):
+    return [cube.monthly_revenue(), cube.monthly_transactions(), cube.weekday_transactions(),
+            cube.item_transactions(), cube.item_revenue(), cube.abc(), cube.frm()]
+
+# Time every pipeline stage on one synthetic dataset of n_rows
+def run_suite(n_rows, workdir, track_memory=True, seed=0):
+    csv_path = os.path.join(workdir, f"transactions_{n_rows}.csv")
+    if not os.path.exists(csv_path):
+        write_transactions_csv(csv_path, n_rows, seed=seed)
+    with open(csv_path, "rb") as f:
+        raw = f.read()
+
+    # Private, in-memory dictionaries so synthetic labels don't leak into the persisted global ones
+    dictionaries = {name: LabelDictionary(name) for name in ["item", "customer"]}
+    results = []
+    def stage(name, func):
+        result, seconds, peak_mb = measure(func, track_memory)
+        results.append({"stage": name, "rows": n_rows, "seconds": round(seconds, 4), "peak_mb": None if peak_mb is None else round(peak_mb, 2)})
+        print(f"{n_rows:>12,} {name:<24} {seconds:>9.3f}s" + ("" if peak_mb is None else f" {peak_mb:>10.1f} MB"), file=sys.stderr)
+        return result
+
+    df = stage("csv_load", lambda: pd.read_csv(csv_path))
+    table = stage("parse_dataset", lambda: parse_dataset(raw, dictionaries))
+    abc_results = stage("abc_analysis", lambda: abc_analysis(df))
+    stage("abc_analysis_compact", lambda: abc_analysis(table))
+    frm_results = stage("frm_analysis", lambda: frm_analysis(df))
+    stage("frm_analysis_compact", lambda: frm_analysis(table))
+    stage("visualize_abc", lambda: visualize_abc(abc_results, os.path.join(workdir, "abc_chart.png")))
+    stage("visualize_frm", lambda: visualize_frm(frm_results, os.path.join(workdir, "frm_chart.png")))
+    cube = stage("insights_cube", lambda: InsightsCube.from_frame(table))
+    stage("insights_rollups", lambda: insights_rollups(cube))
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Stages slower than the baseline by more than threshold (a ratio, e.g. 1.25 = 25% slower)
+def find_regressions(report, baseline, threshold):
+    previous = {(r["stage"], r["rows"]): r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        before = previous.get((result["stage"], result["rows"]))
+        if before and before["seconds"] > 0 and result["seconds"] / before["seconds"] > threshold:
+            regressions.append({**result, "baseline_seconds": before["seconds"], "ratio": round(result["seconds"] / before["seconds"], 2)})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CSV load, ABC/FRM analysis, chart and Insights stages.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 1_000_000])
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    parser.add_argument("--compare", metavar="BASELINE_JSON", help="Fail if a stage is slower than in this earlier report")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Allowed slowdown ratio when comparing")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--workdir", help="Directory for generated datasets (default: a temporary directory)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        os.makedirs(workdir, exist_ok=True)
+        results = []
+        for n_rows in args.rows:
+            results.extend(run_suite(n_rows, workdir, track_memory=not args.no_memory))
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,}
+    text = json.dumps(report, indent=1)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = find_regressions(report, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression['stage']} @ {regression['rows']:,} rows: "
+                  f"{regression['baseline_seconds']}s -> {regression['seconds']}s ({regression['ratio']}x)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
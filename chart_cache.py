@@ -0,0 +1,22 @@
+import hashlib
+import os
+import pandas as pd
+from byte_lru import ByteLRU
+
+# Fingerprint of the aggregated data a chart is drawn from; identical inputs render identical charts
+def chart_fingerprint(kind, data, fmt="png"):
+    digest = hashlib.blake2b(f"{kind}:{fmt}:".encode(), digest_size=16)
+    digest.update(",".join(map(str, data.columns if isinstance(data, pd.DataFrame) else [data.name])).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+# Rendered chart bytes keyed by fingerprint, bounded by their total size
+class ChartCache(ByteLRU):
+    def __init__(self, max_bytes):
+        super().__init__(max_bytes, sizeof=len)
+
+    def get_or_render(self, key, render):
+        return self.get_or_compute(key, render)
+
+# Process-wide chart cache shared by every Streamlit session
+chart_cache = ChartCache(max_bytes=int(os.environ.get("COFFEEPOINT_CHART_CACHE_MB", "64")) * 1024 * 1024)
@@ -0,0 +1,156 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from analysis_tools import classify_abc, frm_from_aggregates
+
+CSV_DTYPES = {"key": "string", "item": "string", "price": "float64", "customer": "string"}
+
+# Mergeable per-item and per-customer aggregates; memory grows with distinct items and customers, not rows
+class PartialAggregates:
+    def __init__(self, item_revenue=None, customers=None):
+        if item_revenue is None:
+            item_revenue = pd.Series(dtype="float64", name="price").rename_axis("item")
+        if customers is None:
+            customers = pd.DataFrame({
+                "Frequency": pd.Series(dtype="int64"),
+                "LastDate": pd.Series(dtype="datetime64[ns]"),
+                "Monetary": pd.Series(dtype="float64"),}).rename_axis("customer")
+        self.item_revenue = item_revenue
+        self.customers = customers
+
+    # Aggregates of a single chunk of raw transactions
+    @classmethod
+    def from_frame(cls, df):
+        dates = pd.to_datetime(df["date"])
+        prices = df["price"].astype("float64")
+        item_revenue = prices.groupby(df["item"], observed=True).sum()
+        customers = df[["key"]].assign(date=dates, price=prices).groupby(df["customer"], observed=True).agg(
+            Frequency=("key", "count"),
+            LastDate=("date", "max"),
+            Monetary=("price", "sum"),)
+        return cls(item_revenue.rename("price").rename_axis("item"), customers.rename_axis("customer"))
+
+    # Combine two sets of aggregates; existing customers are updated by position, new ones appended
+    def merge(self, other):
+        if self.item_revenue.empty and self.customers.empty:
+            return other
+        item_revenue = self.item_revenue.add(other.item_revenue, fill_value=0).rename("price").rename_axis("item")
+        return PartialAggregates(item_revenue, _merge_customers(self.customers, other.customers))
+
+    def update(self, df):
+        return self.merge(PartialAggregates.from_frame(df))
+
+    # Combine many sets of aggregates (e.g. one per store) with a single concat and groupby, rather
+    # than folding them pairwise, which re-copies the accumulated customers on every merge
+    @classmethod
+    def combine(cls, partials):
+        partials = [partial for partial in partials if not (partial.item_revenue.empty and partial.customers.empty)]
+        if len(partials) <= 1:
+            return partials[0] if partials else cls()
+        item_revenue = pd.concat([partial.item_revenue for partial in partials]).groupby(level=0).sum()
+        customers = pd.concat([partial.customers for partial in partials]).groupby(level=0).agg(
+            Frequency=("Frequency", "sum"),
+            LastDate=("LastDate", "max"),
+            Monetary=("Monetary", "sum"),)
+        return cls(item_revenue.rename("price").rename_axis("item"), customers.rename_axis("customer"))
+
+    def abc(self):
+        return classify_abc(self.item_revenue)
+
+    # current_date defaults to the day after this partial's last purchase; partitions of one dataset share the dataset's
+    def frm(self, current_date=None):
+        return frm_from_aggregates(self.customers.sort_index(), current_date)
+
+    @property
+    def last_date(self):
+        return self.customers["LastDate"].max()
+
+    # Persist the aggregates as two small CSVs so later batches can be appended
+    def save(self, state_dir):
+        os.makedirs(state_dir, exist_ok=True)
+        self.item_revenue.to_csv(os.path.join(state_dir, "item_revenue.csv"))
+        self.customers.to_csv(os.path.join(state_dir, "customers.csv"), date_format="%Y-%m-%d")
+
+    @classmethod
+    def load(cls, state_dir):
+        item_path = os.path.join(state_dir, "item_revenue.csv")
+        customer_path = os.path.join(state_dir, "customers.csv")
+        if not os.path.exists(item_path) or not os.path.exists(customer_path):
+            return cls()
+        item_revenue = pd.read_csv(item_path, index_col="item", dtype={"item": "string"})["price"]
+        customers = pd.read_csv(customer_path, index_col="customer", dtype={"customer": "string"}, parse_dates=["LastDate"])
+        return cls(item_revenue, customers)
+
+def _merge_customers(base, new):
+    positions = base.index.get_indexer(new.index)
+    known = positions >= 0
+    frequency = base["Frequency"].to_numpy(dtype="int64", copy=True)
+    last_date = base["LastDate"].to_numpy(dtype="datetime64[ns]", copy=True)
+    monetary = base["Monetary"].to_numpy(dtype="float64", copy=True)
+    hits = positions[known]
+    frequency[hits] += new["Frequency"].to_numpy(dtype="int64")[known]
+    last_date[hits] = np.maximum(last_date[hits], new["LastDate"].to_numpy(dtype="datetime64[ns]")[known])
+    monetary[hits] += new["Monetary"].to_numpy(dtype="float64")[known]
+    updated = pd.DataFrame({"Frequency": frequency, "LastDate": last_date, "Monetary": monetary}, index=base.index)
+    added = new.loc[~known].astype({"Frequency": "int64", "LastDate": "datetime64[ns]", "Monetary": "float64"})
+    return pd.concat([updated, added]).rename_axis("customer")
+
+# Stream a key,item,date,price,customer CSV and fold each chunk into the aggregates
+def aggregate_csv(path, chunksize=1_000_000):
+    partial = PartialAggregates()
+    for chunk in pd.read_csv(path, chunksize=chunksize, dtype=CSV_DTYPES):
+        partial = partial.update(chunk)
+    return partial
+
+# Stream the CSV into partitions holding disjoint customers (split by a hash of the label), so each
+# partition's FRM rows are final and can be summarized, e.g. sketched, on their own
+def aggregate_csv_partitioned(path, chunksize=1_000_000, partitions=16):
+    from sketches import hash_labels
+    parts = [PartialAggregates() for _ in range(partitions)]
+    for chunk in pd.read_csv(path, chunksize=chunksize, dtype=CSV_DTYPES):
+        owners = hash_labels(chunk["customer"]) % np.uint64(partitions)
+        for owner, rows in chunk.groupby(owners.astype("int64"), sort=False):
+            parts[owner] = parts[owner].update(rows)
+    return parts
+
+def abc_analysis_chunked(path, chunksize=1_000_000):
+    return aggregate_csv(path, chunksize).abc()
+
+def frm_analysis_chunked(path, chunksize=1_000_000):
+    return aggregate_csv(path, chunksize).frm()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run ABC and FRM analysis over a CSV too large to load at once.")
+    parser.add_argument("csv", help="Transactions CSV with key,item,date,price,customer columns")
+    parser.add_argument("--chunksize", type=int, default=1_000_000, help="Rows read per chunk")
+    parser.add_argument("--output-dir", default="output")
+    parser.add_argument("--approximate", type=float, metavar="RANK_ERROR",
+                        help="Segment with median thresholds from mergeable KLL sketches within this rank error (e.g. 0.01) "
+                             "and write segment_differences.csv comparing them with the exact segments")
+    parser.add_argument("--partitions", type=int, default=16, help="Customer partitions sketched separately with --approximate")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.approximate:
+        parts = aggregate_csv_partitioned(args.csv, args.chunksize, args.partitions)
+        partial = PartialAggregates.combine(parts)
+    else:
+        partial = aggregate_csv(args.csv, args.chunksize)
+    partial.abc().to_csv(os.path.join(args.output_dir, "abc_results.csv"), index=False)
+    frm_results = partial.frm()
+    if args.approximate:
+        from sketches import approximate_frm, partition_thresholds, segment_differences
+        # One sketch per partition, merged; the exact table is only used for the comparison
+        current_date = partial.last_date + pd.Timedelta(days=1)
+        thresholds = partition_thresholds((part.frm(current_date) for part in parts), args.approximate, args.chunksize)
+        exact = frm_results
+        frm_results, thresholds = approximate_frm(exact, thresholds=thresholds)
+        agreement, compared, crosstab = segment_differences(exact, frm_results, thresholds)
+        crosstab.to_csv(os.path.join(args.output_dir, "segment_differences.csv"))
+        print(compared.to_string())
+        print(f"{agreement:.2%} of {len(exact):,} customers keep their exact segment")
+    frm_results.to_csv(os.path.join(args.output_dir, "frm_results.csv"))
+
+if __name__ == "__main__":
+    main()
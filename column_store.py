@@ -0,0 +1,250 @@
+import argparse
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from chunked_analysis import CSV_DTYPES
+from compact_table import EPOCH, CompactTable, decode_categorical, encode_labels, format_keys, global_dictionaries, parse_keys
+from dataset_cache import dataset_cache
+from sketches import HyperLogLog
+
+# Transactions are stored as one compressed .npz per chunk and month:
+#   <store>/month=2024-01/part-00000.npz   ({key,item,date,price,customer}, {item,customer}.hll members)
+#   <store>/dictionaries/{item,customer}.npy
+#   <store>/manifest.json    (partitions, key format and a content hash over every file above)
+# item and customer are dictionary encoded as int32 codes, dates are datetime64[D], and keys like
+# ORD-001 are stored as the integers parse_keys gives them (the manifest keeps the prefix and width).
+# npz members are decompressed on access, so reads still only touch the requested columns. The
+# per-part HyperLogLog registers give distinct item and customer counts for any range of months
+# without reading the columns. Stores written before compression (one .npy per column in a
+# part-NNNNN directory) are still read.
+COLUMNS = ["key", "item", "date", "price", "customer"]
+ENCODED_COLUMNS = ["item", "customer"]
+MANIFEST = "manifest.json"
+SKETCH_PRECISION = 12
+
+# Integer keys when the chunk's keys round-trip through the store's key format, else the key strings
+def _encode_keys(keys, key_format):
+    if key_format is not None:
+        codes, chunk_format = parse_keys(keys)
+        if chunk_format.get("prefix") == key_format["prefix"] and \
+                (pd.Series(format_keys(codes, key_format)) == keys.reset_index(drop=True)).all():
+            return codes
+    return keys.to_numpy(dtype="U")
+
+def _file_digest(path, digest):
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+
+# Convert a transactions CSV into a month-partitioned column store, one chunk at a time
+def convert_csv(csv_path, store_dir, chunksize=1_000_000):
+    dictionaries = {name: [] for name in ENCODED_COLUMNS}
+    content = hashlib.blake2b(digest_size=16)
+    partitions = {}
+    key_format = None
+    for chunk_number, chunk in enumerate(pd.read_csv(csv_path, chunksize=chunksize, dtype=CSV_DTYPES)):
+        if chunk_number == 0:
+            key_format = parse_keys(chunk["key"])[1]
+            key_format = None if "labels" in key_format else key_format
+        dates = pd.to_datetime(chunk["date"]).to_numpy(dtype="datetime64[D]")
+        labels = {column: chunk[column].to_numpy(dtype=object) for column in ENCODED_COLUMNS}
+        columns = {
+            "key": _encode_keys(chunk["key"], key_format),
+            "item": encode_labels(labels["item"], dictionaries["item"]),
+            "date": dates,
+            "price": chunk["price"].to_numpy(dtype="float64"),
+            "customer": encode_labels(labels["customer"], dictionaries["customer"]),}
+        months = dates.astype("datetime64[M]")
+        for month in np.unique(months):
+            rows = months == month
+            name = f"month={month}"
+            part = {column: values[rows] for column, values in columns.items()}
+            for column in ENCODED_COLUMNS:
+                part[f"{column}.hll"] = HyperLogLog(SKETCH_PRECISION).update(labels[column][rows]).registers
+            part_path = os.path.join(store_dir, name, f"part-{chunk_number:05d}.npz")
+            os.makedirs(os.path.dirname(part_path), exist_ok=True)
+            np.savez_compressed(part_path, **part)
+            _file_digest(part_path, content)
+            first_day, last_day = str(part["date"].min()), str(part["date"].max())
+            partition = partitions.setdefault(name, {"month": str(month), "rows": 0, "first_day": first_day, "last_day": last_day, "parts": []})
+            partition["rows"] += int(rows.sum())
+            partition["first_day"] = min(partition["first_day"], first_day)
+            partition["last_day"] = max(partition["last_day"], last_day)
+            partition["parts"].append(os.path.relpath(part_path, store_dir))
+
+    os.makedirs(os.path.join(store_dir, "dictionaries"), exist_ok=True)
+    for name, labels in dictionaries.items():
+        np.save(os.path.join(store_dir, "dictionaries", f"{name}.npy"), np.array(labels, dtype="U"))
+        _file_digest(os.path.join(store_dir, "dictionaries", f"{name}.npy"), content)
+    manifest = {"columns": COLUMNS, "key_format": key_format, "content_hash": content.hexdigest(),
+                "partitions": [partitions[name] for name in sorted(partitions)]}
+    with open(os.path.join(store_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+def read_manifest(store_dir):
+    with open(os.path.join(store_dir, MANIFEST)) as f:
+        return json.load(f)
+
+# First and last transaction day of a store, from the manifest alone (month bounds for stores written
+# before partitions recorded their days)
+def store_date_range(store_dir):
+    partitions = read_manifest(store_dir)["partitions"]
+    first, last = partitions[0], partitions[-1]
+    start = first.get("first_day", first["month"])
+    end = last.get("last_day") or str((np.datetime64(last["month"], "M") + 1).astype("datetime64[D]") - 1)
+    return pd.Timestamp(start).date(), pd.Timestamp(end).date()
+
+# Identifier of a store's location, stable as new data is appended to it
+def store_id(store_dir):
+    return hashlib.blake2b(os.path.abspath(store_dir).encode(), digest_size=16).hexdigest()
+
+# Stable identifier of a store's contents, used like the upload hash of a CSV: the content hash written at
+# conversion, so re-converting changed data changes the key. Stores written before the manifest kept one
+# fall back to the manifest plus each part's size and modification time.
+def store_key(store_dir):
+    with open(os.path.join(store_dir, MANIFEST), "rb") as f:
+        manifest = f.read()
+    content_hash = json.loads(manifest).get("content_hash")
+    if content_hash:
+        return content_hash
+    digest = hashlib.blake2b(manifest + os.path.abspath(store_dir).encode(), digest_size=16)
+    for partition in json.loads(manifest)["partitions"]:
+        for part in partition["parts"]:
+            stat = os.stat(os.path.join(store_dir, part))
+            digest.update(f"{part}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+# One column (or sketch) of a part: a member of its .npz, or a memory-mapped .npy in older stores
+def _load_column(store_dir, part, name):
+    path = os.path.join(store_dir, part)
+    if part.endswith(".npz"):
+        with np.load(path) as members:
+            return members[name]
+    return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+# Raw column arrays (codes, day dates, stored keys) of the month partitions overlapping [start, end]
+def _read_columns(store_dir, columns, start=None, end=None):
+    start = None if start is None else np.datetime64(pd.Timestamp(start).date(), "D")
+    end = None if end is None else np.datetime64(pd.Timestamp(end).date(), "D")
+    manifest = read_manifest(store_dir)
+    # The date column is needed to trim boundary partitions even when it was not requested
+    load_columns = columns + ["date"] if (start is not None or end is not None) and "date" not in columns else columns
+
+    pieces = {name: [] for name in load_columns}
+    for partition in manifest["partitions"]:
+        month = np.datetime64(partition["month"], "M")
+        month_start = month.astype("datetime64[D]")
+        month_end = (month + 1).astype("datetime64[D]") - 1
+        if (start is not None and month_end < start) or (end is not None and month_start > end):
+            continue
+        inside = (start is None or month_start >= start) and (end is None or month_end <= end)
+        for part in partition["parts"]:
+            loaded = {name: _load_column(store_dir, part, name) for name in load_columns}
+            if not inside:
+                dates = loaded["date"]
+                rows = np.ones(len(dates), dtype=bool)
+                if start is not None:
+                    rows &= dates >= start
+                if end is not None:
+                    rows &= dates <= end
+                loaded = {name: values[rows] for name, values in loaded.items()}
+            for name, values in loaded.items():
+                pieces[name].append(values)
+    return manifest, pieces
+
+# Key strings from per-part key arrays, formatting the integer ones with the store's key format
+def _decode_keys(pieces, key_format):
+    if not pieces:
+        return pd.array([], dtype="string")
+    if all(piece.dtype.kind == "i" for piece in pieces):
+        return format_keys(np.concatenate(pieces), key_format)
+    return pd.array(np.concatenate([np.asarray(format_keys(piece, key_format), dtype=object) if piece.dtype.kind == "i"
+                                    else piece.astype(object) for piece in pieces]), dtype="string")
+
+# Load only the requested columns from the month partitions overlapping [start, end]
+def read_store(store_dir, columns=None, start=None, end=None):
+    columns = list(columns or COLUMNS)
+    manifest, pieces = _read_columns(store_dir, columns, start, end)
+    data = {}
+    for name in columns:
+        if name == "key":
+            data[name] = _decode_keys(pieces[name], manifest.get("key_format"))
+            continue
+        values = np.concatenate(pieces[name]) if pieces[name] else _empty_column(name)
+        if name in ENCODED_COLUMNS:
+            labels = np.load(os.path.join(store_dir, "dictionaries", f"{name}.npy"))
+            values = decode_categorical(values, labels)
+        elif name == "date":
+            values = values.astype("datetime64[ns]")
+        data[name] = values
+    return pd.DataFrame(data)
+
+# Compact table straight from the stored codes and integer keys, without decoding labels or keys
+def _store_table(store_dir):
+    manifest, pieces = _read_columns(store_dir, COLUMNS)
+    key_format = manifest.get("key_format")
+    if key_format is None or not all(piece.dtype.kind == "i" for piece in pieces["key"]):
+        return CompactTable.from_frame(read_store(store_dir))
+    columns = {name: np.concatenate(pieces[name]) if pieces[name] else _empty_column(name) for name in COLUMNS}
+    # Store codes are remapped onto the process-wide dictionaries every compact table shares
+    for name in ENCODED_COLUMNS:
+        labels = np.load(os.path.join(store_dir, "dictionaries", f"{name}.npy"))
+        columns[name] = global_dictionaries[name].encode(labels.astype(object))[columns[name]]
+    return CompactTable(
+        key=columns["key"].astype("int64"),
+        item=columns["item"],
+        day=(columns["date"] - EPOCH).astype("int32"),
+        price=columns["price"],
+        customer=columns["customer"],
+        key_format=key_format)
+
+# Whole store as a compact table, held in the shared dataset cache so repeat reads skip decoding
+def load_store_table(store_dir):
+    key = store_key(store_dir)
+    table = dataset_cache.get(key)
+    if table is None:
+        table = _store_table(store_dir)
+        dataset_cache.put(key, table)
+    return key, table
+
+# Approximate distinct items and customers in the months overlapping [start, end], merged from the
+# per-part sketches; None for stores written before sketches were added
+def store_distinct_counts(store_dir, start=None, end=None):
+    start = None if start is None else np.datetime64(pd.Timestamp(start).date(), "M")
+    end = None if end is None else np.datetime64(pd.Timestamp(end).date(), "M")
+    sketches = {name: HyperLogLog(SKETCH_PRECISION) for name in ENCODED_COLUMNS}
+    for partition in read_manifest(store_dir)["partitions"]:
+        month = np.datetime64(partition["month"], "M")
+        if (start is not None and month < start) or (end is not None and month > end):
+            continue
+        for part in partition["parts"]:
+            for name, sketch in sketches.items():
+                try:
+                    registers = _load_column(store_dir, part, f"{name}.hll")
+                except (KeyError, FileNotFoundError):
+                    return None
+                sketch.registers = np.maximum(sketch.registers, registers)
+    return {name: sketch.count() for name, sketch in sketches.items()}
+
+def _empty_column(name):
+    dtypes = {"key": "int64", "item": "int32", "date": "datetime64[D]", "price": "float64", "customer": "int32"}
+    return np.empty(0, dtype=dtypes[name])
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a transactions CSV into a month-partitioned column store.")
+    parser.add_argument("csv", help="Transactions CSV with key,item,date,price,customer columns")
+    parser.add_argument("store", help="Directory to write the column store to")
+    parser.add_argument("--chunksize", type=int, default=1_000_000)
+    args = parser.parse_args()
+    manifest = convert_csv(args.csv, args.store, args.chunksize)
+    rows = sum(partition["rows"] for partition in manifest["partitions"])
+    print(f"Wrote {rows:,} rows in {len(manifest['partitions'])} monthly partitions to {args.store}")
+    distinct = store_distinct_counts(args.store)
+    print(f"~{distinct['item']:,} distinct items and ~{distinct['customer']:,} distinct customers "
+          f"(±{HyperLogLog(SKETCH_PRECISION).relative_error:.1%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import json
+import os
+import threading
+from itertools import repeat
+from json.encoder import encode_basestring_ascii
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+EPOCH = np.datetime64("1970-01-01", "D")
+DICTIONARY_DIR = os.environ.get("COFFEEPOINT_DICT_DIR", os.path.join("output", "dictionaries"))
+
+# Codes for values, growing the label list with values seen for the first time
+def encode_labels(values, labels):
+    index = pd.Index(labels)
+    codes = index.get_indexer(values)
+    unseen = codes < 0
+    if unseen.any():
+        new_labels = pd.unique(values[unseen])
+        labels.extend(new_labels.tolist())
+        codes[unseen] = len(index) + pd.Index(new_labels).get_indexer(values[unseen])
+    return codes.astype("int32")
+
+# Categorical from dictionary codes, with categories sorted like the raw strings so groupbys keep their order
+def decode_categorical(codes, labels):
+    if len(codes) < len(labels):
+        # A few rows (e.g. one preview page) only need the labels they use, not the whole dictionary
+        used, codes = np.unique(codes, return_inverse=True)
+        labels = np.asarray(labels, dtype=object)[used]
+    labels = np.asarray(labels, dtype=object)
+    order = np.argsort(labels, kind="stable")
+    remap = np.empty(len(labels), dtype="int32")
+    remap[order] = np.arange(len(labels), dtype="int32")
+    return pd.Categorical.from_codes(remap[codes], categories=labels[order])
+
+# Append-only label dictionary shared by every dataset loaded in this process and persisted to disk.
+# Lookups go through a label -> code dict, so encoding costs grow with the values encoded rather than
+# with every label the process has seen. The file holds one JSON string per line, so labels may contain
+# any character; appends happen under an exclusive file lock after reading what other processes
+# appended, so no label is written twice.
+class LabelDictionary:
+    def __init__(self, name, directory=None):
+        self.name = name
+        self.path = os.path.join(directory, f"{name}.jsonl") if directory else None
+        self.labels = []
+        self._codes = {}
+        self._array = np.empty(0, dtype=object)
+        self._offset = 0
+        self._lock = threading.Lock()
+        if self.path and os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                self._read_appended(f)
+
+    def __len__(self):
+        return len(self.labels)
+
+    # Add labels known to be new and distinct; returns their codes
+    def _append(self, labels):
+        codes = np.arange(len(self.labels), len(self.labels) + len(labels), dtype="int32")
+        self._codes.update(zip(labels, codes.tolist()))
+        self.labels.extend(labels)
+        return codes
+
+    # Labels appended to the file since it was last read; files written by older versions may repeat labels
+    def _read_appended(self, f):
+        f.seek(self._offset)
+        data = f.read()
+        complete = data.rfind(b"\n") + 1
+        if complete:
+            appended = json.loads("[" + ",".join(data[:complete].decode("ascii").splitlines()) + "]")
+            self._append([label for label in dict.fromkeys(appended) if label not in self._codes])
+        self._offset += complete
+
+    # Labels as an object array aligned with the codes, grown in place as labels are added
+    @property
+    def array(self):
+        with self._lock:
+            if len(self._array) < len(self.labels):
+                self._array = np.concatenate([self._array, np.asarray(self.labels[len(self._array):], dtype=object)])
+            return self._array
+
+    def encode(self, values):
+        inverse, uniques = pd.factorize(np.asarray(values, dtype=object), use_na_sentinel=False)
+        with self._lock:
+            codes = np.fromiter(map(self._codes.get, uniques, repeat(-1)), dtype="int32", count=len(uniques))
+            unseen = np.flatnonzero(codes < 0)
+            if len(unseen) and self.path:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, "a+b") as f:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_EX)
+                    # Labels other processes appended meanwhile come first, so none is written twice
+                    size = len(self.labels)
+                    self._read_appended(f)
+                    if len(self.labels) > size:
+                        codes[unseen] = np.fromiter(map(self._codes.get, uniques[unseen], repeat(-1)), dtype="int32", count=len(unseen))
+                        unseen = unseen[codes[unseen] < 0]
+                    codes[unseen] = self._append(uniques[unseen].tolist())
+                    f.write("".join(map(_json_line, self.labels[len(self.labels) - len(unseen):])).encode("ascii"))
+                    f.flush()
+                    self._offset = f.tell()
+            elif len(unseen):
+                codes[unseen] = self._append(uniques[unseen].tolist())
+        return codes[inverse]
+
+    def decode(self, codes):
+        return decode_categorical(codes, self.array)
+
+# One label as a line of the dictionary file (ASCII JSON, so line separators inside labels are escaped)
+def _json_line(label):
+    return encode_basestring_ascii(label) + "\n"
+
+global_dictionaries = {name: LabelDictionary(name, DICTIONARY_DIR) for name in ["item", "customer"]}
+
+# Keys like ORD-001 become integers; the shared prefix and zero padding are kept for display
+def parse_keys(keys):
+    keys = pd.Series(keys, dtype="string")
+    if len(keys) and keys.notna().all():
+        first = keys.iloc[0]
+        prefix = first[:len(first) - len(first.lstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz-_"))]
+        digits = keys.str.slice(len(prefix))
+        if keys.str.startswith(prefix).all() and digits.str.isdigit().all():
+            lengths = digits.str.len()
+            width = int(lengths.min())
+            # Padding is only recoverable if longer keys never start with a zero
+            if not (digits.str.startswith("0") & (lengths > width)).any():
+                return digits.astype("int64").to_numpy(), {"prefix": prefix, "width": width}
+    # Free-form keys fall back to a per-table dictionary
+    labels = []
+    return encode_labels(keys.to_numpy(dtype=object), labels).astype("int64"), {"labels": labels}
+
+# Key strings back from parse_keys integers and their prefix/width format
+def format_keys(key, key_format):
+    digits = pd.Series(key).astype("string").str.zfill(key_format["width"])
+    return (key_format["prefix"] + digits).array
+
+# Prices as int32 cents when every price is a whole number of cents (summed exactly, and shown as the
+# CSV wrote them), else as float64; returns the stored array and the scale dividing it back into prices
+def encode_prices(prices):
+    prices = np.asarray(prices, dtype="float64")
+    cents = np.round(prices * 100)
+    if np.isfinite(cents).all() and np.abs(cents).max(initial=0) < 2 ** 31 and np.array_equal(cents / 100, prices):
+        return cents.astype("int32"), 100
+    return prices, 1
+
+# Table-local codes for shared dictionary codes, and the dictionary code behind each local one
+def _localize(codes, size):
+    if len(codes) < size:
+        used, local = np.unique(codes, return_inverse=True)
+    else:
+        present = np.zeros(size, dtype=bool)
+        present[codes] = True
+        used = np.flatnonzero(present)
+        local = (np.cumsum(present, dtype="int32") - 1)[codes]
+    return local.astype("int32"), used.astype("int32")
+
+# Transactions as flat NumPy columns: integer keys, dictionary codes for item and customer,
+# int32 day ordinals and int32 cent prices (see encode_prices). Labels are only decoded for display.
+# Item and customer codes are given against the shared dictionaries and renumbered over the labels
+# this table uses, so aggregations and decoding scale with the table, not with every label seen.
+class CompactTable:
+    def __init__(self, key, item, day, price, customer, key_format, dictionaries=None):
+        self.dictionaries = dictionaries or global_dictionaries
+        self.key = key
+        self.item, item_codes = _localize(item, len(self.dictionaries["item"]))
+        self.day = day
+        self.price, self.price_scale = encode_prices(price)
+        self.customer, customer_codes = _localize(customer, len(self.dictionaries["customer"]))
+        self.key_format = key_format
+        # Dictionary code of every local code; labels(name) resolves them once
+        self.label_codes = {"item": item_codes, "customer": customer_codes}
+        self._labels = {}
+        # Rows dropped at ingest (ingest.REJECTION_FIELDS), when the table was parsed from a CSV
+        self.rejections = None
+
+    @classmethod
+    def from_frame(cls, df, dictionaries=None):
+        dictionaries = dictionaries or global_dictionaries
+        columns = {}
+        for name in ["item", "customer"]:
+            values = df[name]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # Encode each category once and map the frame's codes through it
+                category_codes = dictionaries[name].encode(values.cat.categories)
+                columns[name] = category_codes[values.cat.codes.to_numpy()]
+            else:
+                columns[name] = dictionaries[name].encode(values.to_numpy(dtype=object))
+        key, key_format = parse_keys(df["key"])
+        dates = pd.to_datetime(df["date"]).to_numpy(dtype="datetime64[D]")
+        return cls(
+            key=key,
+            item=columns["item"],
+            day=(dates - EPOCH).astype("int32"),
+            price=df["price"].to_numpy(dtype="float64"),
+            customer=columns["customer"],
+            key_format=key_format,
+            dictionaries=dictionaries)
+
+    def __len__(self):
+        return len(self.key)
+
+    @property
+    def nbytes(self):
+        columns = [self.key, self.item, self.day, self.price, self.customer] + list(self.label_codes.values())
+        # The rejection report is cached with the table and can hold a row (or more) per input row
+        report = int(self.rejections.memory_usage(deep=True).sum()) if self.rejections is not None else 0
+        return sum(column.nbytes for column in columns) + report
+
+    # Prices of some rows as float64, decoded from the stored cents
+    def prices(self, rows=slice(None)):
+        return self.price[rows] / self.price_scale
+
+    # Labels of the local item or customer codes, as an object array
+    def labels(self, name):
+        if name not in self._labels:
+            self._labels[name] = self.dictionaries[name].array[self.label_codes[name]]
+        return self._labels[name]
+
+    def decode_keys(self, rows=slice(None)):
+        key = self.key[rows]
+        if "labels" in self.key_format:
+            return pd.array(np.asarray(self.key_format["labels"], dtype=object)[key], dtype="string")
+        return format_keys(key, self.key_format)
+
+    # Revenue per item, summed over the integer codes and labelled afterwards
+    def item_revenue(self):
+        labels = self.labels("item")
+        # Cents add up exactly in float64, so totals match the CSV's decimal prices
+        revenue = np.bincount(self.item, weights=self.price, minlength=len(labels)) / self.price_scale
+        order = np.argsort(labels, kind="stable")
+        return pd.Series(revenue[order], index=pd.Index(labels[order], name="item"), name="price")
+
+    # Frequency, LastDate and Monetary per customer code, labelled and sorted by customer
+    def customer_aggregates(self):
+        labels = self.labels("customer")
+        frequency = np.bincount(self.customer, minlength=len(labels))
+        monetary = np.bincount(self.customer, weights=self.price, minlength=len(labels)) / self.price_scale
+        last_day = np.full(len(labels), np.iinfo("int32").min, dtype="int32")
+        np.maximum.at(last_day, self.customer, self.day)
+        order = np.argsort(labels, kind="stable")
+        return pd.DataFrame({
+            "Frequency": frequency[order],
+            "LastDate": (EPOCH + last_day[order]).astype("datetime64[ns]"),
+            "Monetary": monetary[order],}, index=pd.Index(labels[order], name="customer"))
+
+    # Decoded pandas view, e.g. for display; key decoding builds strings so it can be skipped
+    def to_frame(self, rows=slice(None), decode_keys=True):
+        return pd.DataFrame({
+            "key": self.decode_keys(rows) if decode_keys else self.key[rows],
+            "item": decode_categorical(self.item[rows], self.labels("item")),
+            "date": (EPOCH + self.day[rows]).astype("datetime64[ns]"),
+            "price": self.prices(rows),
+            "customer": decode_categorical(self.customer[rows], self.labels("customer")),})
@@ -0,0 +1,41 @@
+import hashlib
+import os
+import pandas as pd
+from byte_lru import ByteLRU
+from compact_table import CompactTable
+from ingest import ingest_csv
+
+MONTH_ORDER = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
+DAY_ORDER = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Content hash of the uploaded bytes, used as the cache key
+def dataset_key(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+# Validate the CSV once and keep its clean rows as a dictionary-encoded CompactTable shared by every
+# section; the rows that failed validation are reported on table.rejections
+def parse_dataset(data, dictionaries=None):
+    clean, rejections = ingest_csv(data)
+    table = CompactTable.from_frame(clean, dictionaries)
+    table.rejections = rejections
+    return table
+
+# Ordered month and weekday name columns derived from the parsed dates
+def add_calendar_columns(df):
+    df["month"] = pd.Categorical.from_codes(df["date"].dt.month.to_numpy() - 1, MONTH_ORDER, ordered=True)
+    df["day_of_week"] = pd.Categorical.from_codes(df["date"].dt.dayofweek.to_numpy(), DAY_ORDER, ordered=True)
+    return df
+
+# Parsed tables keyed by content hash, bounded by their total in-memory size
+class DatasetCache(ByteLRU):
+    # key, when given, is dataset_key(data) computed earlier, so the bytes aren't hashed again
+    def get_or_parse(self, data, key=None):
+        key = key or dataset_key(data)
+        return key, self.get_or_compute(key, lambda: parse_dataset(data))
+
+# Process-wide cache shared by every Streamlit session
+dataset_cache = DatasetCache(max_bytes=int(os.environ.get("COFFEEPOINT_CACHE_MB", "1024")) * 1024 * 1024)
+
+# Tables returned here are shared between sessions and must be treated as read-only
+def load_dataset(uploaded_file, key=None):
+    return dataset_cache.get_or_parse(uploaded_file.getvalue(), key)
@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+
+FRM_FEATURES = ["Frequency", "Recency", "Monetary"]
+CENTROIDS_PATH = os.environ.get("COFFEEPOINT_CENTROIDS", os.path.join("output", "frm_centroids.json"))
+CENTROIDS_DIR = os.path.join(os.path.dirname(CENTROIDS_PATH), "centroids")
+
+# Saved centroids of one dataset or store, so a fit on one never warm-starts (or overwrites) another's
+def centroids_path(name):
+    return os.path.join(CENTROIDS_DIR, f"{name}.json")
+
+# Model features for the given rows: Frequency and Monetary are heavy-tailed, so they are log-scaled
+def frm_features(columns, rows):
+    features = np.column_stack([column[rows] for column in columns]).astype("float64")
+    features[:, [0, 2]] = np.log1p(np.maximum(features[:, [0, 2]], 0))
+    return features
+
+def _frm_columns(frm):
+    return [frm[name].to_numpy() for name in FRM_FEATURES]
+
+# Squared distance from every row to every centroid
+def _distances(features, centroids):
+    return (features ** 2).sum(axis=1)[:, None] - 2 * features @ centroids.T + (centroids ** 2).sum(axis=1)
+
+# Mini-batch k-means (Sculley, 2010) over standardized FRM features. Customers are processed batch_size
+# rows at a time, so working memory is bounded by the batch rather than the customer count. Refits
+# warm-start from the current centroids and cluster sizes, and saved centroids let new customers be
+# assigned without refitting.
+class FRMClusterModel:
+    def __init__(self, n_clusters=4, batch_size=10_000, max_epochs=20, tol=1e-3, seed=0):
+        self.n_clusters = n_clusters
+        self.batch_size = max(batch_size, 2 * n_clusters)
+        self.max_epochs = max_epochs
+        self.tol = tol
+        self.seed = seed
+        self.mean = None
+        self.scale = None
+        self.centroids = None
+        self.counts = None
+        self.n_customers = 0
+        self.epochs = 0
+        self.fitted_at = None
+
+    @property
+    def fitted(self):
+        return self.centroids is not None
+
+    def _batches(self, n_rows, rng=None):
+        order = np.arange(n_rows) if rng is None else rng.permutation(n_rows)
+        return np.array_split(order, max(1, -(-n_rows // self.batch_size)))
+
+    # Streaming mean and standard deviation of the features, one batch at a time
+    def _scaler(self, columns, n_rows):
+        total = np.zeros(len(FRM_FEATURES))
+        squares = np.zeros(len(FRM_FEATURES))
+        for rows in self._batches(n_rows):
+            features = frm_features(columns, rows)
+            total += features.sum(axis=0)
+            squares += (features ** 2).sum(axis=0)
+        mean = total / n_rows
+        scale = np.sqrt(np.maximum(squares / n_rows - mean ** 2, 0))
+        return mean, np.where(scale > 0, scale, 1.0)
+
+    def _transform(self, columns, rows):
+        return (frm_features(columns, rows) - self.mean) / self.scale
+
+    # k-means++ seeding on one random batch
+    def _seed_centroids(self, columns, n_rows, rng):
+        sample = self._transform(columns, rng.choice(n_rows, size=min(n_rows, self.batch_size), replace=False))
+        centroids = [sample[rng.integers(len(sample))]]
+        for _ in range(1, self.n_clusters):
+            weights = _distances(sample, np.array(centroids)).min(axis=1).clip(min=0)
+            total = weights.sum()
+            centroids.append(sample[rng.choice(len(sample), p=weights / total) if total > 0 else rng.integers(len(sample))])
+        return np.array(centroids)
+
+    def fit(self, frm):
+        if len(frm) < self.n_clusters:
+            raise ValueError(f"Need at least {self.n_clusters} customers to fit {self.n_clusters} clusters, got {len(frm)}.")
+        columns, n_rows = _frm_columns(frm), len(frm)
+        rng = np.random.default_rng(self.seed)
+        mean, scale = self._scaler(columns, n_rows)
+        warm = self.fitted
+        if warm:
+            # Re-express the previous centroids in this fit's feature scale; the previous cluster sizes
+            # (capped at one pass over today's data) damp the first updates so centroids don't jump
+            centroids = (self.centroids * self.scale + self.mean - mean) / scale
+            counts = self.counts * min(1.0, n_rows / max(self.counts.sum(), 1))
+            self.mean, self.scale = mean, scale
+        else:
+            self.mean, self.scale = mean, scale
+            centroids = self._seed_centroids(columns, n_rows, rng)
+            counts = np.zeros(self.n_clusters)
+
+        previous_inertia = None
+        for epoch in range(1, self.max_epochs + 1):
+            inertia = 0.0
+            epoch_counts = np.zeros(self.n_clusters, dtype="int64")
+            for rows in self._batches(n_rows, rng):
+                features = self._transform(columns, rows)
+                distances = _distances(features, centroids)
+                labels = distances.argmin(axis=1)
+                inertia += distances[np.arange(len(labels)), labels].sum()
+                # Each centroid moves towards its batch mean with a per-centroid learning rate of 1 / count
+                batch_counts = np.bincount(labels, minlength=self.n_clusters)
+                sums = np.vstack([np.bincount(labels, weights=features[:, j], minlength=self.n_clusters) for j in range(features.shape[1])]).T
+                counts += batch_counts
+                epoch_counts += batch_counts
+                moved = batch_counts > 0
+                centroids[moved] += (sums[moved] - batch_counts[moved, None] * centroids[moved]) / counts[moved, None]
+            # Clusters nobody joined (common after warm-starting on shifted data) restart at the worst-fitting customers
+            empty = np.flatnonzero(epoch_counts == 0)
+            if len(empty):
+                worst = distances.min(axis=1).argsort()[::-1][:len(empty)]
+                centroids[empty[:len(worst)]] = features[worst]
+                counts[empty] = 0
+                previous_inertia = None
+                continue
+            # Stop once a full pass no longer lowers the mean squared distance by more than tol
+            inertia /= n_rows
+            if previous_inertia is not None and abs(previous_inertia - inertia) <= self.tol * previous_inertia:
+                break
+            previous_inertia = inertia
+        if not warm:
+            # Fresh fits number clusters from the highest to the lowest spending; warm starts keep the previous numbering
+            order = np.argsort(-centroids[:, 2], kind="stable")
+            centroids = centroids[order]
+        self.centroids = centroids
+        self.counts = self._cluster_sizes(columns, n_rows)
+        self.n_customers = n_rows
+        self.epochs = epoch
+        self.fitted_at = time.time()
+        return self
+
+    def _labels(self, columns, n_rows):
+        labels = np.empty(n_rows, dtype="int8")
+        for rows in self._batches(n_rows):
+            labels[rows] = _distances(self._transform(columns, rows), self.centroids).argmin(axis=1)
+        return labels
+
+    def _cluster_sizes(self, columns, n_rows):
+        return np.bincount(self._labels(columns, n_rows), minlength=self.n_clusters).astype("float64")
+
+    # Nearest centroid per customer, computed in batches with plain NumPy
+    def predict(self, frm):
+        if not self.fitted:
+            raise ValueError("The clustering model has not been fitted.")
+        labels = self._labels(_frm_columns(frm), len(frm))
+        return pd.Categorical.from_codes(labels, categories=self.cluster_names())
+
+    def fit_predict(self, frm):
+        return self.fit(frm).predict(frm)
+
+    def cluster_names(self):
+        return [f"Cluster {i + 1}" for i in range(self.n_clusters)]
+
+    # Centroids back in FRM units (Frequency in purchases, Recency in days, Monetary in $)
+    def centroids_frame(self):
+        features = self.centroids * self.scale + self.mean
+        features[:, [0, 2]] = np.expm1(features[:, [0, 2]])
+        return pd.DataFrame(features, columns=FRM_FEATURES, index=pd.Index(self.cluster_names(), name="Cluster"))
+
+    def save(self, path=CENTROIDS_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        state = {
+            "n_clusters": self.n_clusters,
+            "mean": self.mean.tolist(),
+            "scale": self.scale.tolist(),
+            "centroids": self.centroids.tolist(),
+            "counts": self.counts.tolist(),
+            "n_customers": self.n_customers,
+            "epochs": self.epochs,
+            "fitted_at": self.fitted_at,}
+        # Write then rename so a concurrent load never sees a half-written file
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f, indent=1)
+        os.replace(path + ".tmp", path)
+
+    # A fitted model from saved centroids, or an unfitted one when nothing has been saved yet
+    @classmethod
+    def load(cls, path=CENTROIDS_PATH, **kwargs):
+        if not os.path.exists(path):
+            return cls(**kwargs)
+        with open(path) as f:
+            state = json.load(f)
+        model = cls(**{**kwargs, "n_clusters": state["n_clusters"]})
+        model.mean = np.array(state["mean"])
+        model.scale = np.array(state["scale"])
+        model.centroids = np.array(state["centroids"])
+        model.counts = np.array(state["counts"])
+        model.n_customers = state["n_customers"]
+        model.epochs = state["epochs"]
+        model.fitted_at = state["fitted_at"]
+        return model
+
+def main():
+    from chunked_analysis import aggregate_csv
+    parser = argparse.ArgumentParser(description="Cluster customers on Frequency, Recency and Monetary with mini-batch k-means.")
+    parser.add_argument("csv", help="Transactions CSV with key,item,date,price,customer columns")
+    parser.add_argument("--centroids", default=CENTROIDS_PATH, help="Saved centroids; refits warm-start from them")
+    parser.add_argument("--clusters", type=int, default=4, help="Number of clusters for a fresh fit")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="Customers per mini-batch")
+    parser.add_argument("--assign-only", action="store_true", help="Assign customers to the saved centroids without refitting")
+    parser.add_argument("--chunksize", type=int, default=1_000_000, help="Rows read per chunk")
+    parser.add_argument("--output", default=os.path.join("output", "frm_clusters.csv"))
+    args = parser.parse_args()
+
+    model = FRMClusterModel.load(args.centroids, n_clusters=args.clusters, batch_size=args.batch_size)
+    if args.assign_only and not model.fitted:
+        parser.error(f"no saved centroids at {args.centroids}")
+    frm = aggregate_csv(args.csv, args.chunksize).frm()
+    if not args.assign_only:
+        start = time.perf_counter()
+        model.fit(frm)
+        model.save(args.centroids)
+        print(f"Fitted {model.n_clusters} clusters on {len(frm):,} customers in {model.epochs} epochs ({time.perf_counter() - start:.1f}s)")
+    frm["Cluster"] = model.predict(frm)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    frm.to_csv(args.output)
+    print(model.centroids_frame().round(2).to_string())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import argparse
+import hashlib
+import os
+import shutil
+import pandas as pd
+from chunked_analysis import CSV_DTYPES, PartialAggregates, aggregate_csv
+
+DEFAULT_STATE_DIR = os.path.join("output", "state")
+# One "<content hash> <path>" line per batch already folded into the state
+APPLIED_BATCHES = "applied_batches.txt"
+
+# A batch whose contents were already folded into the state; applying it again would double-count it
+class BatchAlreadyApplied(ValueError):
+    pass
+
+# Content hash of a batch file, so a replay is recognised even under another name
+def batch_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Persisted aggregates and the hashes of the batches they contain
+def load_state(state_dir=DEFAULT_STATE_DIR):
+    previous = state_dir.rstrip(os.sep) + ".old"
+    # A save interrupted between its two renames leaves only the previous state behind
+    if not os.path.exists(state_dir) and os.path.exists(previous):
+        os.replace(previous, state_dir)
+    applied = {}
+    path = os.path.join(state_dir, APPLIED_BATCHES)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                digest, _, name = line.rstrip("\n").partition(" ")
+                applied[digest] = name
+    return PartialAggregates.load(state_dir), applied
+
+# Write the new state beside the old one and swap directories, so readers and crashes only ever
+# see a complete state
+def save_state(state, applied, state_dir=DEFAULT_STATE_DIR):
+    state_dir = state_dir.rstrip(os.sep)
+    staging, previous = state_dir + ".new", state_dir + ".old"
+    shutil.rmtree(staging, ignore_errors=True)
+    state.save(staging)
+    with open(os.path.join(staging, APPLIED_BATCHES), "w", encoding="utf-8") as f:
+        f.write("".join(f"{digest} {name}\n" for digest, name in applied.items()))
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(state_dir):
+        os.replace(state_dir, previous)
+    os.replace(staging, state_dir)
+    shutil.rmtree(previous, ignore_errors=True)
+
+# Fold new batches of transactions into the persisted state and re-derive ABC classes and FRM segments.
+# The whole call is refused before anything changes if any batch (or the same file twice) was already
+# applied; with verify, the state is only saved if it matches a full recompute over that history CSV.
+def append_batches(paths, state_dir=DEFAULT_STATE_DIR, verify=None):
+    state, applied = load_state(state_dir)
+    new = {}
+    for path in paths:
+        digest = batch_hash(path)
+        if digest in applied or digest in new:
+            raise BatchAlreadyApplied(f"{path} was already applied (as {applied.get(digest) or new[digest]})")
+        new[digest] = path
+    for path in paths:
+        state = state.update(pd.read_csv(path, dtype=CSV_DTYPES))
+    if verify:
+        verify_against_full(state, verify)
+    save_state(state, {**applied, **new}, state_dir)
+    return state
+
+def write_results(state, output_dir="output"):
+    os.makedirs(output_dir, exist_ok=True)
+    abc_results = state.abc()
+    frm_results = state.frm()
+    abc_results.to_csv(os.path.join(output_dir, "abc_results.csv"), index=False)
+    frm_results.to_csv(os.path.join(output_dir, "frm_results.csv"))
+    return abc_results, frm_results
+
+# Raise if the incremental state disagrees with a full recompute over the whole history
+def verify_against_full(state, history_csv, chunksize=1_000_000):
+    full = aggregate_csv(history_csv, chunksize)
+    pd.testing.assert_frame_equal(state.abc().astype({"item": "string"}), full.abc().astype({"item": "string"}))
+    pd.testing.assert_frame_equal(state.frm(), full.frm())
+
+def main():
+    parser = argparse.ArgumentParser(description="Append new transactions to the persisted ABC/FRM state.")
+    parser.add_argument("batches", nargs="+", help="CSV files with new key,item,date,price,customer rows")
+    parser.add_argument("--state-dir", default=DEFAULT_STATE_DIR)
+    parser.add_argument("--output-dir", default="output")
+    parser.add_argument("--verify", metavar="HISTORY_CSV", help="Compare the result with a full recompute over this file; "
+                                                                "the state is only saved if they match")
+    args = parser.parse_args()
+
+    try:
+        state = append_batches(args.batches, args.state_dir, args.verify)
+    except BatchAlreadyApplied as exc:
+        parser.error(f"{exc}; nothing was changed")
+    except AssertionError as exc:
+        parser.exit(1, f"Incremental results differ from a full recompute; the state was not saved.\n{exc}\n")
+    if args.verify:
+        print("Incremental results match a full recompute.")
+    write_results(state, args.output_dir)
+
+if __name__ == "__main__":
+    main()
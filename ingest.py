@@ -0,0 +1,187 @@
+import argparse
+import os
+from io import BytesIO
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+# Schema every analysis relies on; extra columns are ignored at ingest
+REQUIRED_COLUMNS = ["key", "item", "date", "price", "customer"]
+DATE_FORMAT = "%Y-%m-%d"
+REJECTION_FIELDS = ["line", "column", "reason", "value", "action"]
+
+# The file as a whole cannot be used (unreadable, required columns missing, or no valid rows)
+class IngestError(ValueError):
+    pass
+
+def _source(data):
+    return BytesIO(data) if isinstance(data, bytes) else data
+
+def _bytes(data):
+    if isinstance(data, bytes):
+        return data
+    with open(data, "rb") as f:
+        return f.read()
+
+# Physical line number (1-based) of every CSV record, header included. Records end at newlines outside
+# quotes, so a quoted field may span lines; blank lines are skipped, as both CSV readers do.
+def record_lines(data):
+    buf = np.frombuffer(_bytes(data), dtype="uint8")
+    newlines = np.flatnonzero(buf == ord("\n"))
+    quotes = np.flatnonzero(buf == ord('"'))
+    # A newline is inside a quoted field when an odd number of quotes precede it ("" escapes count twice)
+    ends = newlines[np.searchsorted(quotes, newlines) % 2 == 0] if len(quotes) else newlines
+    # Whatever follows the last record end (no final newline, or a quote left open) is one more record
+    if len(buf) > (ends[-1] + 1 if len(ends) else 0):
+        ends = np.append(ends, len(buf))
+    starts = np.concatenate([[0], ends + 1])[:len(ends)]
+    lengths = ends - starts
+    blank = lengths == 0
+    single = np.flatnonzero(lengths == 1)
+    blank[single] = buf[starts[single]] == ord("\r")
+    return np.searchsorted(newlines, starts[~blank]) + 1
+
+def _check_header(data):
+    try:
+        columns = pd.read_csv(_source(data), nrows=0).columns
+    except (ValueError, pd.errors.ParserError) as exc:
+        raise IngestError(f"Could not read the CSV header: {exc}") from exc
+    missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+    if missing:
+        raise IngestError(f"Missing required column(s): {', '.join(missing)}. Expected {','.join(REQUIRED_COLUMNS)}.")
+
+# Strictly typed read; raises pyarrow's ArrowInvalid on the first value that doesn't fit the schema
+def _read_typed(data, date_format):
+    labels = pa.dictionary(pa.int32(), pa.string())
+    table = pa_csv.read_csv(_source(data), convert_options=pa_csv.ConvertOptions(
+        include_columns=REQUIRED_COLUMNS,
+        column_types={"key": pa.string(), "item": labels, "date": pa.timestamp("s"), "price": pa.float64(), "customer": labels},
+        timestamp_parsers=[date_format],
+        strings_can_be_null=True,))
+    return table.to_pandas()
+
+# Every column as text, so malformed values survive to be reported row by row. Returns the frame and
+# the records with the wrong number of fields as (record number, header = 1, fields, expected, text);
+# pyarrow skips and lists them, while without it they make the whole file unreadable.
+def _read_text(data):
+    invalid = []
+    def skip_invalid(row):
+        invalid.append((row.number, row.actual_columns, row.expected_columns, row.text))
+        return "skip"
+    try:
+        if pa is not None:
+            # Single-threaded, so skipped rows carry their record number
+            table = pa_csv.read_csv(_source(data),
+                read_options=pa_csv.ReadOptions(use_threads=False),
+                parse_options=pa_csv.ParseOptions(newlines_in_values=True, invalid_row_handler=skip_invalid),
+                convert_options=pa_csv.ConvertOptions(
+                    include_columns=REQUIRED_COLUMNS, column_types={name: pa.string() for name in REQUIRED_COLUMNS}, strings_can_be_null=True,))
+            return table.to_pandas(), invalid
+        return pd.read_csv(_source(data), usecols=REQUIRED_COLUMNS, dtype={"key": "string", "item": "category", "date": "string", "price": "string", "customer": "category"}), invalid
+    # ArrowInvalid and pandas' ParserError are both ValueErrors, as are undecodable bytes
+    except ValueError as exc:
+        raise IngestError(f"Could not parse the CSV: {exc}") from exc
+
+# Validate and coerce a frame in one vectorized pass. Rows with a missing value, a date not in
+# date_format or a non-numeric/negative price are rejected; repeated keys after the first are
+# rejected (duplicates="drop") or only reported (duplicates="keep"). Returns the clean, typed frame
+# and one report row per problem, with its line number in the CSV: lines gives the line of every row
+# (or a function returning them, only called if there is something to report), by default one line
+# per row after the header.
+def validate_frame(df, date_format=DATE_FORMAT, duplicates="drop", lines=None):
+    missing = [name for name in REQUIRED_COLUMNS if name not in df.columns]
+    if missing:
+        raise IngestError(f"Missing required column(s): {', '.join(missing)}. Expected {','.join(REQUIRED_COLUMNS)}.")
+    dates = df["date"] if pd.api.types.is_datetime64_any_dtype(df["date"]) else pd.to_datetime(df["date"], format=date_format, errors="coerce")
+    prices = df["price"] if pd.api.types.is_numeric_dtype(df["price"]) else pd.to_numeric(df["price"], errors="coerce")
+
+    problems = [(df[name].isna().to_numpy(), name, "missing value") for name in REQUIRED_COLUMNS]
+    problems += [
+        ((dates.isna() & df["date"].notna()).to_numpy(), "date", f"not a {date_format} date"),
+        ((prices.isna() & df["price"].notna()).to_numpy(), "price", "not a number"),
+        ((prices < 0).to_numpy(dtype=bool, na_value=False), "price", "negative price"),]
+    rejected = np.logical_or.reduce([mask for mask, _, _ in problems])
+    # Only rows that are otherwise valid compete for a key, so a bad first copy doesn't drop a good one
+    keys = df["key"].where(~rejected) if rejected.any() else df["key"]
+    duplicated = keys.duplicated().to_numpy() & ~rejected
+    problems = [(mask, name, reason, "rejected") for mask, name, reason in problems]
+    problems.append((duplicated, "key", "duplicate key", "rejected" if duplicates == "drop" else "kept"))
+    if duplicates == "drop":
+        rejected |= duplicated
+
+    if lines is None:
+        lines = df.index.to_numpy() + 2
+    elif callable(lines) and any(mask.any() for mask, _, _, _ in problems):
+        lines = lines()
+    report = pd.concat([pd.DataFrame({
+        "line": lines[mask],
+        "column": name,
+        "reason": reason,
+        "value": df[name].to_numpy(dtype=object)[mask],
+        "action": action,}) for mask, name, reason, action in problems if mask.any()] or [pd.DataFrame(columns=REJECTION_FIELDS)], ignore_index=True)
+    report = report.sort_values("line", kind="stable", ignore_index=True)
+
+    clean = df[["key", "item", "customer"]].assign(date=dates, price=prices)[REQUIRED_COLUMNS]
+    if rejected.any():
+        clean = clean[~rejected]
+    clean = clean.astype({"item": "category", "date": "datetime64[ns]", "price": "float64", "customer": "category"})
+    return clean.reset_index(drop=True), report
+
+# Number of input rows left out (a row can have several problems in the report)
+def rejected_rows(report):
+    return report.loc[report["action"] == "rejected", "line"].nunique()
+
+# Read and validate a whole CSV (bytes or a path). Clean files take the strictly typed pyarrow read
+# when pyarrow is installed; files it rejects are re-read as text so every bad row can be reported,
+# including rows with the wrong number of fields. Raises IngestError if no row is usable.
+def ingest_csv(data, date_format=DATE_FORMAT, duplicates="drop"):
+    _check_header(data)
+    df, invalid = None, []
+    if pa is not None:
+        try:
+            df = _read_typed(data, date_format)
+        except pa.ArrowInvalid:
+            df = None
+    if df is None:
+        df, invalid = _read_text(data)
+    # Line numbers are only worked out when a row is reported; they skip blank lines and follow quoted line breaks
+    numbers = np.array([number for number, _, _, _ in invalid], dtype="int64")
+    lines = lambda: np.delete(record_lines(data)[1:], numbers - 2)
+    clean, report = validate_frame(df, date_format, duplicates, lines)
+    if invalid:
+        malformed = pd.DataFrame({
+            "line": record_lines(data)[numbers - 1],
+            "column": None,
+            "reason": [f"{fields} fields instead of {expected}" for _, fields, expected, _ in invalid],
+            "value": [text for _, _, _, text in invalid],
+            "action": "rejected",})
+        report = pd.concat([report, malformed], ignore_index=True).sort_values("line", kind="stable", ignore_index=True)
+    if not len(clean):
+        detail = f" ({rejected_rows(report):,} rejected, the first at line {report['line'].iloc[0]}: {report['reason'].iloc[0]})" if len(report) else ""
+        raise IngestError(f"No valid rows{detail}.")
+    return clean, report
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate a transactions CSV and write the clean rows and a rejection report.")
+    parser.add_argument("csv", help="Transactions CSV with key,item,date,price,customer columns")
+    parser.add_argument("--output-dir", default="output")
+    parser.add_argument("--date-format", default=DATE_FORMAT)
+    parser.add_argument("--keep-duplicates", action="store_true", help="Report repeated keys but keep the rows")
+    args = parser.parse_args()
+
+    try:
+        clean, report = ingest_csv(args.csv, args.date_format, "keep" if args.keep_duplicates else "drop")
+    except IngestError as exc:
+        parser.exit(1, f"{args.csv}: {exc}\n")
+    os.makedirs(args.output_dir, exist_ok=True)
+    clean.to_csv(os.path.join(args.output_dir, "clean_transactions.csv"), index=False, date_format=args.date_format)
+    report.to_csv(os.path.join(args.output_dir, "rejections.csv"), index=False)
+    print(f"{len(clean):,} clean rows, {rejected_rows(report):,} rejected; {len(report):,} problems listed in rejections.csv")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import os
+import shutil
+import threading
+import pandas as pd
+from analysis_tools import classify_abc, frm_from_aggregates
+from byte_lru import ByteLRU
+from compact_table import CompactTable
+from dataset_cache import add_calendar_columns
+
+CUBE_DIMENSIONS = ["month", "day_of_week", "item"]
+# Version of the pickled cube tables; bump it when they change so older cubes on disk are ignored and pruned
+CUBE_FORMAT = 2
+
+# Revenue and transaction counts per month x weekday x item
+def _cube_cells(df):
+    cells = df["price"].astype("float64").groupby([df[name] for name in CUBE_DIMENSIONS], observed=True).agg(["sum", "count"])
+    return cells.rename(columns={"sum": "revenue", "count": "transactions"})
+
+# Pre-aggregated revenue/transactions by month x weekday x item plus per-customer FRM aggregates.
+# Everything on the Insights page is derived from these two small tables.
+class InsightsCube:
+    def __init__(self, cells, customers):
+        self.cells = cells
+        self.customers = customers
+
+    @classmethod
+    def from_frame(cls, df):
+        # Compact tables aggregate customers straight from their codes
+        if isinstance(df, CompactTable):
+            return cls(_cube_cells(add_calendar_columns(df.to_frame(decode_keys=False))), df.customer_aggregates())
+        if "month" not in df.columns:
+            df = add_calendar_columns(df.copy())
+        customers = df[["key"]].assign(date=pd.to_datetime(df["date"]), price=df["price"].astype("float64")).groupby(df["customer"], observed=True).agg(
+            Frequency=("key", "count"),
+            LastDate=("date", "max"),
+            Monetary=("price", "sum"),)
+        return cls(_cube_cells(df), customers)
+
+    def _rollup(self, dimension, measure):
+        return self.cells[measure].groupby(level=dimension, observed=True).sum()
+
+    def monthly_revenue(self):
+        return self._rollup("month", "revenue")
+
+    def monthly_transactions(self):
+        return self._rollup("month", "transactions")
+
+    def weekday_transactions(self):
+        return self._rollup("day_of_week", "transactions")
+
+    def item_transactions(self):
+        return self._rollup("item", "transactions")
+
+    def item_revenue(self):
+        return self._rollup("item", "revenue")
+
+    def abc(self):
+        return classify_abc(self.item_revenue())
+
+    def frm(self):
+        return frm_from_aggregates(self.customers)
+
+    @property
+    def nbytes(self):
+        return int(self.cells.memory_usage(deep=True).sum() + self.customers.memory_usage(deep=True).sum())
+
+    # Each table is written beside its final name and renamed into place, customers.pkl last, so a
+    # reader that finds customers.pkl also finds a complete cells.pkl
+    def save(self, cube_dir):
+        os.makedirs(cube_dir, exist_ok=True)
+        suffix = f".tmp-{os.getpid()}-{threading.get_ident()}"
+        for name, table in [("cells.pkl", self.cells), ("customers.pkl", self.customers)]:
+            path = os.path.join(cube_dir, name)
+            table.to_pickle(path + suffix)
+            os.replace(path + suffix, path)
+
+    @classmethod
+    def load(cls, cube_dir):
+        return cls(pd.read_pickle(os.path.join(cube_dir, "cells.pkl")), pd.read_pickle(os.path.join(cube_dir, "customers.pkl")))
+
+# Process-wide cube cache keyed by dataset hash, bounded by the cubes' size, and backed by an optional
+# on-disk directory holding v<CUBE_FORMAT>-<key> cubes, pruned to the most recently used max_disk_bytes
+class CubeCache(ByteLRU):
+    def __init__(self, max_bytes, cache_dir=None, max_disk_bytes=None):
+        super().__init__(max_bytes)
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+
+    def get_or_build(self, key, load_frame):
+        return self.get_or_compute(key, lambda: self._load_or_build(key, load_frame))
+
+    def _load_or_build(self, key, load_frame):
+        if not self.cache_dir:
+            return InsightsCube.from_frame(load_frame())
+        cube_dir = os.path.join(self.cache_dir, f"v{CUBE_FORMAT}-{key}")
+        if os.path.exists(os.path.join(cube_dir, "customers.pkl")):
+            try:
+                cube = InsightsCube.load(cube_dir)
+                os.utime(cube_dir)
+                return cube
+            except OSError:
+                # Pruned by another process while loading; rebuild it
+                pass
+        cube = InsightsCube.from_frame(load_frame())
+        cube.save(cube_dir)
+        self._prune(cube_dir)
+        return cube
+
+    # Drop cubes of other formats, then the least recently used ones beyond max_disk_bytes (never keep)
+    def _prune(self, keep):
+        current, total = [], 0
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if not os.path.isdir(path):
+                continue
+            if not name.startswith(f"v{CUBE_FORMAT}-"):
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                current.append((os.path.getmtime(path), size, path))
+            except OSError:
+                continue
+            total += size
+        if self.max_disk_bytes is None:
+            return
+        for _, size, path in sorted(current):
+            if total <= self.max_disk_bytes:
+                break
+            if path != keep:
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+cube_cache = CubeCache(
+    max_bytes=int(os.environ.get("COFFEEPOINT_CUBE_CACHE_MB", "256")) * 1024 * 1024,
+    cache_dir=os.environ.get("COFFEEPOINT_CUBE_DIR", os.path.join("output", "cubes")),
+    max_disk_bytes=int(os.environ.get("COFFEEPOINT_CUBE_DISK_MB", "1024")) * 1024 * 1024)
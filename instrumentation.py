@@ -0,0 +1,101 @@
+import json
+import os
+import time
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+RECORD_FIELDS = ["run", "stage", "seconds", "rows", "memory_delta_mb", "started_at"]
+
+# Resident set size of this process in bytes; /proc is cheap to read, getrusage is the portable fallback (peak RSS)
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, IndexError, ValueError):
+        if resource is None:
+            return 0
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class _Stage:
+    def __init__(self, recorder, name, rows):
+        self.recorder = recorder
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self._rss = _rss_bytes()
+        self._started_at = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._start
+        self.recorder._add({
+            "run": self.recorder.run,
+            "stage": self.name,
+            "seconds": round(seconds, 5),
+            "rows": self.rows,
+            "memory_delta_mb": round((_rss_bytes() - self._rss) / 1e6, 2),
+            "started_at": self._started_at,})
+        return False
+
+# Shared no-op stage handed out while instrumentation is off; callers may still set .rows on it
+class _NullStage:
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+# Per-session record of stage timings, grouped by rerun; does nothing until enabled
+class StageRecorder:
+    def __init__(self, enabled=False, max_records=2000):
+        self.enabled = enabled
+        self.max_records = max_records
+        self.run = 0
+        self.records = []
+
+    def start_run(self):
+        self.run += 1
+
+    # Context manager timing one stage: with recorder.stage("frm_analysis", rows=len(df)): ...
+    def stage(self, name, rows=None):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, rows)
+
+    def _add(self, record):
+        self.records.append(record)
+        if len(self.records) > self.max_records:
+            del self.records[:len(self.records) - self.max_records]
+
+    def to_frame(self, run=None):
+        df = pd.DataFrame(self.records, columns=RECORD_FIELDS)
+        return df if run is None else df[df["run"] == run]
+
+    # Total time, rows and memory per stage over the whole session
+    def summary(self):
+        df = self.to_frame()
+        return df.groupby("stage").agg(
+            calls=("seconds", "size"),
+            total_seconds=("seconds", "sum"),
+            mean_seconds=("seconds", "mean"),
+            rows=("rows", "max"),
+            memory_delta_mb=("memory_delta_mb", "sum"),).sort_values("total_seconds", ascending=False)
+
+    def to_json(self):
+        return json.dumps(self.records, indent=1, default=str)
+
+    def to_csv(self):
+        return self.to_frame().to_csv(index=False)
+
+    def clear(self):
+        self.records.clear()
@@ -0,0 +1,105 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+class JobCancelled(Exception):
+    pass
+
+# A unit of analysis work keyed by (dataset hash, analysis type), shared by every session that asks for it
+class Job:
+    def __init__(self, key):
+        self.key = key
+        self.progress = 0.0
+        self.message = "Queued"
+        self.subscribers = set()
+        self.future = None
+        self._cancel = threading.Event()
+
+    # Called by the work function between stages; raises once the job has been cancelled
+    def update(self, progress, message):
+        if self._cancel.is_set():
+            raise JobCancelled(self.key)
+        self.progress = progress
+        self.message = message
+
+    def cancel(self):
+        self._cancel.set()
+        self.future.cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def done(self):
+        return self.future.done()
+
+    def result(self):
+        return self.future.result()
+
+# Bounded thread pool that de-duplicates jobs across sessions and cancels the ones nobody waits for.
+# Threads rather than processes so jobs can share the cached in-memory datasets without pickling them.
+class JobPool:
+    def __init__(self, max_workers=4, max_finished=64):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis")
+        self._jobs = OrderedDict()
+        self._session_jobs = {}
+        self._max_finished = max_finished
+        self._lock = threading.Lock()
+
+    def _run(self, job, func):
+        job.update(0.0, "Running")
+        result = func(job)
+        job.progress = 1.0
+        job.message = "Done"
+        return result
+
+    # Submit func(job) under key for a session. A session can wait on several jobs at once (e.g. the
+    # date index and the page's analysis); they stay subscribed until the session releases them. Jobs
+    # are of a kind (e.g. "frm_kmeans" for every date range); submitting a new key releases the session's
+    # older job of the same kind, so a superseded request is cancelled unless another session waits on it.
+    def submit(self, key, func, session_id, kind=None):
+        with self._lock:
+            session_jobs = self._session_jobs.setdefault(session_id, {})
+            if kind is not None:
+                for other_key, other_kind in list(session_jobs.items()):
+                    if other_kind == kind and other_key != key:
+                        self._release(other_key, session_id)
+                        del session_jobs[other_key]
+            job = self._jobs.get(key)
+            if job is None or job.cancelled or (job.done() and job.future.exception() is not None):
+                job = Job(key)
+                job.future = self._executor.submit(self._run, job, func)
+                self._jobs[key] = job
+            self._jobs.move_to_end(key)
+            job.subscribers.add(session_id)
+            session_jobs[key] = kind
+            self._evict_finished()
+        return job
+
+    # Drop a session's interest in all of its jobs, e.g. when it navigates away; jobs no other
+    # session waits on are cancelled
+    def release(self, session_id):
+        with self._lock:
+            for key in self._session_jobs.pop(session_id, {}):
+                self._release(key, session_id)
+
+    def _release(self, key, session_id):
+        job = self._jobs.get(key)
+        if job is None:
+            return
+        job.subscribers.discard(session_id)
+        if not job.subscribers and not job.done():
+            job.cancel()
+            del self._jobs[key]
+
+    def _evict_finished(self):
+        finished = [key for key, job in self._jobs.items() if job.done()]
+        for key in finished[:max(0, len(finished) - self._max_finished)]:
+            del self._jobs[key]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+# Process-wide pool shared by every Streamlit session
+job_pool = JobPool(max_workers=int(os.environ.get("COFFEEPOINT_WORKERS", "4")))
@@ -0,0 +1,155 @@
+import os
+import numpy as np
+import pandas as pd
+from byte_lru import ByteLRU
+from compact_table import EPOCH, CompactTable
+from sketches import KLLSketch
+
+# Paged, server-side view of a transactions dataset for the Overview page. Only the rows on the
+# visible page are decoded, and the summary statistics come from one chunked pass per dataset.
+PREVIEW_COLUMNS = ["key", "item", "date", "price", "customer"]
+LABEL_COLUMNS = ["item", "customer"]
+
+# Dictionary codes and their labels for an item/customer column of a compact table or frame
+def _label_codes(df, column):
+    if isinstance(df, CompactTable):
+        return getattr(df, column), df.labels(column)
+    values = df[column]
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype("category")
+    return values.cat.codes.to_numpy(), values.cat.categories.to_numpy(dtype=object)
+
+def _label_rank(labels):
+    rank = np.empty(len(labels), dtype="int64")
+    rank[np.argsort(labels, kind="stable")] = np.arange(len(labels))
+    return rank
+
+# Values that sort like the displayed column; labels sort by their text, not their codes
+def _sort_values(df, column):
+    if column in LABEL_COLUMNS:
+        codes, labels = _label_codes(df, column)
+        return _label_rank(labels)[codes]
+    if isinstance(df, CompactTable):
+        if column == "key" and "labels" in df.key_format:
+            return _label_rank(np.asarray(df.key_format["labels"], dtype=object))[df.key]
+        return {"key": df.key, "date": df.day, "price": df.price}[column]
+    return df[column].to_numpy()
+
+# Rows whose item/customer label contains filter_text, as a boolean mask (None when nothing is filtered)
+def filter_mask(df, filter_column=None, filter_text=""):
+    if filter_column not in LABEL_COLUMNS or not filter_text:
+        return None
+    codes, labels = _label_codes(df, filter_column)
+    matches = pd.Series(labels, dtype="string").str.contains(filter_text, case=False, regex=False).to_numpy(dtype=bool)
+    return matches[codes]
+
+# Stable ascending order of all rows by one column
+def sort_order(df, sort_by):
+    return np.argsort(_sort_values(df, sort_by), kind="stable")
+
+# Row positions for a sorted and/or filtered view, or None for the dataset in its own order.
+# A filter keeps the relative order of the full sort order, so order can be computed once per column and reused.
+def preview_rows(df, sort_by=None, descending=False, filter_column=None, filter_text="", order=None):
+    mask = filter_mask(df, filter_column, filter_text)
+    if not sort_by:
+        return None if mask is None else np.flatnonzero(mask)
+    if order is None:
+        order = sort_order(df, sort_by)
+    if descending:
+        order = order[::-1]
+    return order if mask is None else order[mask[order]]
+
+def preview_page(df, rows, start, size):
+    positions = slice(start, start + size) if rows is None else rows[start:start + size]
+    if isinstance(df, CompactTable):
+        return df.to_frame(positions)
+    return df.iloc[positions]
+
+# Mean and squared deviations of one chunk, merged with Chan et al.'s parallel update
+def _merge_moments(moments, values):
+    count, mean, m2 = moments
+    n = len(values)
+    if n == 0:
+        return moments
+    chunk_mean = values.mean()
+    chunk_m2 = ((values - chunk_mean) ** 2).sum()
+    total = count + n
+    delta = chunk_mean - mean
+    return total, mean + delta * n / total, m2 + chunk_m2 + delta ** 2 * count * n / total
+
+# describe()-style statistics for date and price, plus per-column info, from one pass over chunk_size rows
+# at a time. Quartiles come from KLL sketches (exact below ~8,000 rows, otherwise within quantile_error rank).
+def summary_statistics(df, chunk_size=1_000_000, quantile_error=0.0002):
+    n_rows = len(df)
+    compact = isinstance(df, CompactTable)
+    numeric = {"date": df.day if compact else df["date"].to_numpy(dtype="datetime64[D]").astype("int64"),
+               "price": df.price if compact else df["price"].to_numpy()}
+    # Compact prices are stored in cents
+    scales = {"date": 1, "price": df.price_scale if compact else 1}
+    moments = {name: (0, 0.0, 0.0) for name in numeric}
+    extremes = {name: [np.inf, -np.inf] for name in numeric}
+    quantiles = {name: KLLSketch.from_error(quantile_error) for name in numeric}
+    non_null = {name: 0 for name in PREVIEW_COLUMNS}
+    labels = {name: _label_codes(df, name) for name in LABEL_COLUMNS}
+    seen = {name: np.zeros(len(labels[name][1]), dtype=bool) for name in LABEL_COLUMNS}
+
+    for start in range(0, n_rows, chunk_size):
+        rows = slice(start, start + chunk_size)
+        for name, column in numeric.items():
+            values = np.asarray(column[rows], dtype="float64") / scales[name]
+            values = values[~np.isnan(values)]
+            non_null[name] += len(values)
+            moments[name] = _merge_moments(moments[name], values)
+            if len(values):
+                extremes[name] = [min(extremes[name][0], values.min()), max(extremes[name][1], values.max())]
+            quantiles[name].update(values)
+        for name, (codes, _) in labels.items():
+            chunk = codes[rows]
+            chunk = chunk[chunk >= 0]
+            non_null[name] += len(chunk)
+            seen[name][chunk] = True
+        non_null["key"] += len(df.key[rows]) if compact else int(df["key"].iloc[rows].notna().sum())
+
+    stats = {}
+    for name in numeric:
+        count, mean, m2 = moments[name]
+        low, high = extremes[name] if count else (np.nan, np.nan)
+        stats[name] = [count, mean if count else np.nan, low] + [quantiles[name].quantile(q) for q in (0.25, 0.5, 0.75)] \
+            + [high, np.sqrt(m2 / (count - 1)) if count > 1 else np.nan]
+    describe = pd.DataFrame(stats, index=["count", "mean", "min", "25%", "50%", "75%", "max", "std"])
+    # Dates were summarized as day ordinals; show them as dates again, with the spread as a duration
+    days = describe["date"].to_numpy()
+    describe["date"] = [f"{int(days[0])}"] + [str(pd.Timestamp(EPOCH) + pd.Timedelta(days=day)) if np.isfinite(day) else "NaT" for day in days[1:7]] \
+        + [str(pd.Timedelta(days=days[7]).round("s")) if np.isfinite(days[7]) else "NaT"]
+
+    dtypes = {"key": "string", "item": "category", "date": "datetime64[D]" if compact else str(df["date"].dtype),
+              "price": "float64" if compact else str(numeric["price"].dtype), "customer": "category"}
+    info = pd.DataFrame({
+        "Dtype": [dtypes[name] for name in PREVIEW_COLUMNS],
+        "Non-Null Count": [non_null[name] for name in PREVIEW_COLUMNS],
+        "Distinct": pd.array([int(seen[name].sum()) if name in LABEL_COLUMNS else None for name in PREVIEW_COLUMNS], dtype="Int64"),},
+        index=pd.Index(PREVIEW_COLUMNS, name="Column"))
+    return describe, info
+
+# Size of a cached value: a row order, or the summary's describe/info frames
+def _nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, tuple):
+        return sum(_nbytes(part) for part in value)
+    return int(value.memory_usage(deep=True).sum())
+
+# Process-wide summaries and per-column sort orders, keyed by dataset hash and bounded by their total size.
+# Filtered views are derived from a cached order on each rerun, so typing a filter adds no entries.
+class PreviewCache(ByteLRU):
+    def __init__(self, max_bytes):
+        super().__init__(max_bytes, sizeof=_nbytes)
+
+    def summary(self, data_key, df):
+        return self.get_or_compute((data_key, "summary"), lambda: summary_statistics(df))
+
+    def rows(self, data_key, df, sort_by=None, descending=False, filter_column=None, filter_text=""):
+        order = self.get_or_compute((data_key, "order", sort_by), lambda: sort_order(df, sort_by)) if sort_by else None
+        return preview_rows(df, sort_by, descending, filter_column, filter_text, order)
+
+preview_cache = PreviewCache(max_bytes=int(os.environ.get("COFFEEPOINT_PREVIEW_CACHE_MB", "256")) * 1024 * 1024)
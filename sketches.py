@@ -0,0 +1,177 @@
+from functools import reduce
+import numpy as np
+import pandas as pd
+from analysis_tools import FRM_SEGMENTS, assign_frm_segments, frm_thresholds
+
+# Mergeable approximate aggregates. Each sketch is built per chunk or partition and merged in
+# constant space, so thresholds and distinct counts no longer need the full table in one place.
+
+# KLL quantile sketch (Karnin, Lang & Liberty, 2016): a stack of compactors where level h holds
+# items of weight 2^h; an overfull level sorts itself and promotes every other item.
+class KLLSketch:
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    # Smallest k whose normalized rank error stays within error (DataSketches' empirical single-quantile bound)
+    @classmethod
+    def from_error(cls, error, seed=0):
+        return cls(k=int(np.ceil((2.296 / error) ** (1 / 0.9723))), seed=seed)
+
+    @property
+    def rank_error(self):
+        return 2.296 / self.k ** 0.9723
+
+    @property
+    def nbytes(self):
+        return sum(level.nbytes for level in self.levels)
+
+    def _capacity(self, level):
+        return max(8, int(np.ceil(self.k * (2 / 3) ** (len(self.levels) - level - 1))))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays behind; the rest halve, keeping the even or odd positions at random
+                rest, items = items[:len(items) % 2], items[len(items) % 2:]
+                self.levels[level] = rest
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], items[self._rng.integers(2)::2]])
+            level += 1
+
+    def update(self, values):
+        values = np.asarray(values, dtype="float64").ravel()
+        values = values[~np.isnan(values)]
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        merged = KLLSketch(min(self.k, other.k))
+        merged._rng = self._rng
+        merged.n = self.n + other.n
+        depth = max(len(self.levels), len(other.levels))
+        merged.levels = [np.concatenate([a[h] for a in (self.levels, other.levels) if h < len(a)]) for h in range(depth)]
+        merged._compress()
+        return merged
+
+    def quantile(self, q):
+        if self.n == 0:
+            return np.nan
+        # Nothing compacted yet: every value is still held, so answer exactly (interpolated like pandas)
+        if len(self.levels) == 1:
+            return float(np.quantile(self.levels[0], q))
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** h) for h, items in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        cumulative = np.cumsum(weights[order])
+        return values[order][min(np.searchsorted(cumulative, q * cumulative[-1]), len(values) - 1)]
+
+    def median(self):
+        return self.quantile(0.5)
+
+# 64-bit hashes of labels; the same label hashes alike whether it is stored as str, object or categorical
+def hash_labels(values):
+    return pd.util.hash_pandas_object(pd.Series(values, copy=False), index=False).to_numpy()
+
+# HyperLogLog distinct counter (Flajolet et al., 2007) with 2^p one-byte registers and the small-range correction
+class HyperLogLog:
+    def __init__(self, p=12):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype="uint8")
+
+    # Smallest register count whose standard error 1.04 / sqrt(m) stays within error
+    @classmethod
+    def from_error(cls, error):
+        return cls(p=int(np.clip(np.ceil(np.log2((1.04 / error) ** 2)), 4, 18)))
+
+    @property
+    def relative_error(self):
+        return 1.04 / np.sqrt(len(self.registers))
+
+    @property
+    def nbytes(self):
+        return self.registers.nbytes
+
+    def update(self, values):
+        hashes = hash_labels(values)
+        buckets = (hashes >> np.uint64(64 - self.p)).astype("int64")
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        # Position of the leftmost 1-bit in the remaining 64 - p bits; frexp is exact below 2^53
+        bit_length = np.frexp(rest.astype("float64"))[1]
+        ranks = (64 - self.p - bit_length + 1).astype("uint8")
+        np.maximum.at(self.registers, buckets, ranks)
+        return self
+
+    def merge(self, other):
+        if self.p != other.p:
+            raise ValueError("HyperLogLog sketches must have the same precision to merge.")
+        merged = HyperLogLog(self.p)
+        merged.registers = np.maximum(self.registers, other.registers)
+        return merged
+
+    def count(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.ldexp(1.0, -self.registers.astype("int64")).sum()
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+# Median sketches of Recency, Frequency and Monetary over per-customer FRM rows, for approximate segment thresholds
+class FRMSketch:
+    def __init__(self, quantile_error=0.01, seed=0):
+        self.quantile_error = quantile_error
+        self.sketches = {axis: KLLSketch.from_error(quantile_error, seed) for axis in ["Recency", "Frequency", "Monetary"]}
+
+    @classmethod
+    def from_frame(cls, frm, quantile_error=0.01, chunk_size=100_000):
+        sketch = cls(quantile_error)
+        for start in range(0, len(frm), chunk_size):
+            sketch.update(frm.iloc[start:start + chunk_size])
+        return sketch
+
+    def update(self, frm):
+        for axis, sketch in self.sketches.items():
+            sketch.update(frm[axis].to_numpy())
+        return self
+
+    def merge(self, other):
+        merged = FRMSketch(self.quantile_error)
+        merged.sketches = {axis: sketch.merge(other.sketches[axis]) for axis, sketch in self.sketches.items()}
+        return merged
+
+    def thresholds(self):
+        return {axis: sketch.median() for axis, sketch in self.sketches.items()}
+
+# Median thresholds from one sketch per partition of FRM rows, merged; partitions must hold disjoint
+# customers (e.g. chunked_analysis.aggregate_csv_partitioned) and share one current date
+def partition_thresholds(frm_parts, quantile_error=0.01, chunk_size=100_000):
+    sketches = (FRMSketch.from_frame(part, quantile_error, chunk_size) for part in frm_parts)
+    return reduce(FRMSketch.merge, sketches, FRMSketch(quantile_error)).thresholds()
+
+# FRM table with segments assigned from sketched instead of exact median thresholds; thresholds
+# merged from partition sketches can be given, otherwise the table itself is sketched
+def approximate_frm(frm, quantile_error=0.01, chunk_size=100_000, thresholds=None):
+    if thresholds is None:
+        thresholds = FRMSketch.from_frame(frm, quantile_error, chunk_size).thresholds()
+    approximate = frm.drop(columns="Segment", errors="ignore")
+    approximate["Segment"] = assign_frm_segments(approximate, thresholds)
+    return approximate, thresholds
+
+# How sketched segments differ from the exact ones: share of customers whose segment is unchanged,
+# thresholds side by side, and an exact x approximate crosstab of segment counts
+def segment_differences(exact, approximate, thresholds):
+    agreement = float((exact["Segment"].to_numpy() == approximate["Segment"].to_numpy()).mean()) if len(exact) else 1.0
+    compared = pd.DataFrame({"exact": pd.Series(frm_thresholds(exact)), "approximate": pd.Series(thresholds)})
+    crosstab = pd.crosstab(pd.Categorical(exact["Segment"], categories=FRM_SEGMENTS),
+                           pd.Categorical(approximate["Segment"], categories=FRM_SEGMENTS),
+                           rownames=["exact"], colnames=["approximate"], dropna=False)
+    return agreement, compared, crosstab
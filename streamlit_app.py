@@ -4,10 +4,23 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime
-from analysis_tools import abc_analysis, frm_analysis, visualize_abc, visualize_frm, frm_3d_scatter_with_segments
-from io import StringIO
+from analysis_tools import FRM_SEGMENTS, abc_analysis, frm_analysis, visualize_abc, visualize_frm, frm_3d_scatter_with_segments
+from dataset_cache import load_dataset, dataset_key
+from insights_cube import cube_cache
+from column_store import read_manifest, read_store, load_store_table, store_id, store_key, store_date_range, store_distinct_counts, MANIFEST
+from compact_table import EPOCH
+from jobs import job_pool
+from chart_cache import chart_cache, chart_fingerprint
+from windowed import index_cache
+from ingest import IngestError, rejected_rows
+from preview import preview_cache, preview_page, PREVIEW_COLUMNS, LABEL_COLUMNS
+from frm_clustering import FRMClusterModel, centroids_path
+from sketches import approximate_frm, segment_differences
+from instrumentation import StageRecorder
 import plotly.express as px
 import os
+import time
+import uuid
 
 # Page configuration
 st.set_page_config(page_title="Advanced Coffee Point Analysis", layout="wide", page_icon=":coffee:")
@@ -60,11 +73,111 @@ menu = st.sidebar.radio("Go to", ["Topic", "Instruction", "Overview", "ABC Analy
 # File uploader
 st.sidebar.subheader("Upload Your Data")
 uploaded_file = st.sidebar.file_uploader(":red[Upload your CSV file]", type=["csv"])
+store_dir = st.sidebar.text_input(":red[Or open a columnar store]", placeholder="path/to/store", help="Create one with `python column_store.py data.csv path/to/store`")
+has_store = bool(store_dir) and os.path.exists(os.path.join(store_dir, MANIFEST))
+if store_dir and not has_store:
+    st.sidebar.error("No column store found at that path.")
+has_data = bool(uploaded_file) or has_store
+# The upload's content hash, computed once per uploaded file; reruns, tab switches and job polling reuse it
+upload_key = None
+if uploaded_file:
+    if st.session_state.get("upload_file_id") != uploaded_file.file_id:
+        st.session_state["upload_key"] = dataset_key(uploaded_file.getvalue())
+        st.session_state["upload_file_id"] = uploaded_file.file_id
+    upload_key = st.session_state["upload_key"]
+
+# Opt-in per-stage timings for this session, shown in the sidebar performance panel
+profiler = st.session_state.setdefault("profiler", StageRecorder())
+profiler.enabled = st.sidebar.toggle("Record performance", value=profiler.enabled)
+profiler.start_run()
+
+# Uploads are validated once at ingest and cached with the parsed table; unusable files stop here.
+# The first visit parses and validates the CSV, so it is timed as its own stage (cache hits are near zero).
+if uploaded_file and menu in ["Overview", "ABC Analysis", "FRM Analysis", "Insights"]:
+    try:
+        with profiler.stage("parse_csv") as stage:
+            table = load_dataset(uploaded_file, upload_key)[1]
+            stage.rows = len(table)
+    except IngestError as exc:
+        st.sidebar.error(f"{uploaded_file.name}: {exc}")
+        has_data = has_store
+    else:
+        if len(table.rejections):
+            st.sidebar.warning(f"{rejected_rows(table.rejections):,} rows failed validation and were left out; see the report in Overview.")
+
+# Load the dataset for a section; column stores only read the columns that section needs
+def load_data(columns=None):
+    with profiler.stage("load_data") as stage:
+        if uploaded_file:
+            data_key, df = load_dataset(uploaded_file, upload_key)
+        else:
+            data_key, df = store_key(store_dir), read_store(store_dir, columns=columns)
+        stage.rows = len(df)
+    return data_key, df
+
+# Identifier of the current dataset, computed without parsing (or re-hashing) it
+def current_data_key():
+    return upload_key if uploaded_file else store_key(store_dir)
+
+# Heavy analyses run on the shared worker pool; identical requests from other sessions reuse the same job
+session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+if st.session_state.get("last_menu") != menu:
+    # Switching sections supersedes whatever this session was waiting on
+    job_pool.release(session_id)
+    st.session_state["last_menu"] = menu
+
+# Analyses named "<kind>:<variant>" (e.g. one k-means fit per date range) supersede this session's
+# earlier variant of the same kind, so dragging a slider doesn't queue a job per position
+def run_job(analysis, func):
+    job = job_pool.submit((current_data_key(), analysis), func, session_id, kind=analysis.partition(":")[0])
+    if not job.done():
+        st.progress(job.progress, text=job.message)
+        time.sleep(0.25)
+        st.rerun()
+    return job.result()
+
+# Date window for the ABC, FRM and Insights pages. The slider bounds come from the parsed upload or the
+# store manifest (None for a dataset without transactions); a window is only computed once the range is
+# narrowed, so full-range views cost nothing extra
+def date_bounds():
+    if uploaded_file:
+        table = load_dataset(uploaded_file, upload_key)[1]
+        if not len(table):
+            return None
+        return pd.Timestamp(EPOCH + table.day.min()).date(), pd.Timestamp(EPOCH + table.day.max()).date()
+    return store_date_range(store_dir) if read_manifest(store_dir)["partitions"] else None
+
+window = None
+if has_data and menu in ["ABC Analysis", "FRM Analysis", "Insights"]:
+    bounds = date_bounds()
+    if bounds is None:
+        st.sidebar.error("The dataset has no transactions.")
+        has_data = False
+if has_data and menu in ["ABC Analysis", "FRM Analysis", "Insights"]:
+    first_day, last_day = bounds
+    start_day, end_day = st.sidebar.slider(":red[Date range]", min_value=first_day, max_value=last_day, value=(first_day, last_day))
+    if (start_day, end_day) != (first_day, last_day):
+        # One prefix-sum index per dataset, built on the first narrowed range and kept in index_cache,
+        # answers every later window with a few array differences
+        def index_job(job):
+            job.update(0.1, "Indexing transactions by date")
+            with profiler.stage("date_index"):
+                data_key, table = load_dataset(uploaded_file, upload_key) if uploaded_file else load_store_table(store_dir)
+                return index_cache.get_or_build(data_key, lambda: table)
+        window = run_job("date_index", index_job).window(start_day, end_day)
+# Narrowed ranges can hold no transactions at all
+has_rows = has_data and (window is None or len(window) > 0)
+
+# Chart output, timed as its own stage; figures are closed so reruns don't accumulate them
+def show_pyplot(fig):
+    with profiler.stage("pyplot_render"):
+        st.pyplot(fig, use_container_width=False)
+    plt.close(fig)
+
+def show_plotly(fig):
+    with profiler.stage("plotly_render"):
+        st.plotly_chart(fig, use_container_width=True)
 
-# Ensure output directory exists
-output_dir = "output"
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
 # Topic session
 if menu == "Topic":
     # st.header(":star: Topic")
@@ -122,87 +235,153 @@ if menu == "Instruction":
 # Home Section
 if menu == "Overview":
     st.header(":coffee: :blue[Upload and View Data]")
-    if uploaded_file:
-        df = pd.read_csv(uploaded_file)
+    if has_data:
+        # Both sources are held as compact tables, so a rerun only decodes the visible page
+        with profiler.stage("load_data"):
+            data_key, df = load_dataset(uploaded_file, upload_key) if uploaded_file else load_store_table(store_dir)
+        # Summary statistics come from one chunked pass per dataset, shared by every session
+        def summary_job(job):
+            job.update(0.1, "Summarizing dataset")
+            with profiler.stage("summary_statistics", rows=len(df)):
+                return preview_cache.summary(data_key, df)
+        describe, info = run_job("summary", summary_job)
         col1, col2, col3= st.columns([3.8,2,3.4])
         with col1:
             st.write("Dataset Preview")
-            st.dataframe(df,hide_index =True)
+            # Only the visible page is decoded and sent to the browser; sorting and filtering run server-side
+            sort_col, order_col, filter_col, text_col = st.columns([1.2, 1, 1.2, 1.4])
+            sort_by = sort_col.selectbox("Sort by", [None] + PREVIEW_COLUMNS, format_func=lambda c: "(file order)" if c is None else c)
+            descending = order_col.selectbox("Order", ["Ascending", "Descending"]) == "Descending"
+            filter_column = filter_col.selectbox("Filter", [None] + LABEL_COLUMNS, format_func=lambda c: "(none)" if c is None else c)
+            filter_text = text_col.text_input("Contains", disabled=filter_column is None)
+            with profiler.stage("preview_rows", rows=len(df)):
+                rows = preview_cache.rows(data_key, df, sort_by, descending, filter_column, filter_text)
+            total = len(df) if rows is None else len(rows)
+            size_col, page_col = st.columns(2)
+            page_size = size_col.selectbox("Rows per page", [25, 50, 100, 500], index=1)
+            pages = max(1, -(-total // page_size))
+            page = page_col.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, value=1)
+            start = (page - 1) * page_size
+            with profiler.stage("preview_page", rows=page_size):
+                st.dataframe(preview_page(df, rows, start, page_size), hide_index=True)
+            st.caption(f"Rows {min(start + 1, total):,}-{min(start + page_size, total):,} of {total:,}")
         with col3:
             st.write("Quick Info")
-            buffer = StringIO()
-            df.info(buf=buffer)
-            st.text(buffer.getvalue())
+            st.write(f"{len(df):,} rows, {len(info)} columns")
+            st.dataframe(info)
+            if df.rejections is not None and len(df.rejections):
+                with st.expander(f":warning: {rejected_rows(df.rejections):,} rows rejected at ingest"):
+                    st.dataframe(df.rejections.head(1000), hide_index=True)
+                    st.download_button("Download rejection report", df.rejections.to_csv(index=False), file_name="rejections.csv", mime="text/csv")
         with col2:
             st.write("Statistical Summary")
-            st.dataframe(df.describe())
+            st.dataframe(describe)
     else:
         st.warning("Please upload a CSV file.")
 
 # ABC Analysis Section
 if menu == "ABC Analysis":
     st.header(":chart_with_upwards_trend: :blue[ABC Analysis]")
-    if uploaded_file:
-        df = pd.read_csv(uploaded_file)
-        abc_results = abc_analysis(df)
+    if has_rows:
+        if window is not None:
+            with profiler.stage("abc_window"):
+                abc_results = window.abc()
+        else:
+            data_key, df = load_data(["item", "price"])
+            with profiler.stage("abc_analysis", rows=len(df)):
+                abc_results = abc_analysis(df)
         col1, col2 = st.columns([1.5, 2])
         with col1:
             st.write("ABC Analysis Table")
             st.dataframe(abc_results)
         with col2:
-            abc_chart_path = os.path.join(output_dir, "abc_chart.png")
-            visualize_abc(abc_results, abc_chart_path)
-            st.image(abc_chart_path, caption="ABC Analysis Chart", use_column_width=True)
+            # Rendered charts are cached in memory by input fingerprint, so repeat views skip matplotlib
+            with profiler.stage("visualize_abc", rows=len(abc_results)):
+                abc_chart = chart_cache.get_or_render(chart_fingerprint("abc", abc_results), lambda: visualize_abc(abc_results))
+            st.image(abc_chart, caption="ABC Analysis Chart", use_column_width=True)
 
         st.subheader(":red[Key Insights]")
-        total_sales = df["price"].sum()
+        total_sales = abc_results["price"].sum()
         category_summary = abc_results.groupby("ABC")["price"].sum()
         for cat, value in category_summary.items():
             st.write(f"- Category {cat}: ${value:.2f} ({(value/total_sales)*100:.2f}%)")
+    elif has_data:
+        st.warning("No transactions in the selected date range; widen it in the sidebar.")
     else:
         st.warning("Please upload a CSV file.")
 
 # FRM Analysis Section
 if menu == "FRM Analysis":
     st.header(":busts_in_silhouette: :blue[FRM Analysis]")
-    if uploaded_file:
-        df = pd.read_csv(uploaded_file)
-        frm_results = frm_analysis(df)
+    if has_rows:
+        def frm_job(job):
+            job.update(0.1, "Loading dataset")
+            _, df = load_data(["key", "date", "price", "customer"])
+            job.update(0.5, "Segmenting customers")
+            with profiler.stage("frm_analysis", rows=len(df)):
+                return frm_analysis(df)
+        if window is not None:
+            with profiler.stage("frm_window"):
+                frm_results = window.frm()
+        else:
+            frm_results = run_job("frm", frm_job)
         col1, col2 = st.columns([1.5, 2])
         with col1:
             st.write("FRM Analysis Table")
             st.dataframe(frm_results)
         with col2:
-            frm_chart_path = os.path.join(output_dir, "frm_chart.png")
-            visualize_frm(frm_results, frm_chart_path)
-            st.image(frm_chart_path, caption="FRM Analysis Chart", use_column_width=True)
+            with profiler.stage("visualize_frm", rows=len(frm_results)):
+                segment_counts = frm_results["Segment"].value_counts()
+                frm_chart = chart_cache.get_or_render(chart_fingerprint("frm", segment_counts), lambda: visualize_frm(frm_results))
+            st.image(frm_chart, caption="FRM Analysis Chart", use_column_width=True)
 
         st.subheader(":red[Customer Segmentation Insights]")
         segment_counts = frm_results["Segment"].value_counts()
         for segment, count in segment_counts.items():
             st.write(f"- Segment {segment}: {count} customers")
+
+        # Sketched thresholds are what partitioned or streaming runs would use; compare them with the exact medians
+        # The comparison sketches every customer, so it only runs on request and on the worker pool
+        # (an expander's body would run on every rerun, even collapsed)
+        if st.checkbox("Compare with approximate thresholds (quantile sketches)"):
+            rank_error = st.select_slider("Rank error", options=[0.001, 0.005, 0.01, 0.02, 0.05], value=0.01, format_func=lambda e: f"{e:.1%}")
+            def sketch_job(job):
+                job.update(0.2, "Sketching FRM thresholds")
+                with profiler.stage("frm_sketch", rows=len(frm_results)):
+                    approximate, thresholds = approximate_frm(frm_results, rank_error)
+                    return segment_differences(frm_results, approximate, thresholds)
+            period = "all" if window is None else f"{start_day}:{end_day}"
+            agreement, compared, crosstab = run_job(f"frm_sketch:{period}:{rank_error}", sketch_job)
+            st.write(f"{agreement:.2%} of customers keep their exact segment with sketched medians.")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.dataframe(compared)
+            with col2:
+                st.dataframe(crosstab)
+    elif has_data:
+        st.warning("No transactions in the selected date range; widen it in the sidebar.")
     else:
         st.warning("Please upload a CSV file.")
 
 # Insights Section
 if menu == "Insights":
     st.header(":bar_chart: :blue[Additional Insights]")
-    if uploaded_file:
-        df = pd.read_csv(uploaded_file)
-        df["date"] = pd.to_datetime(df["date"])
-        
-        # Extract 'month' and 'day_of_week' columns
-        df['month'] = df['date'].dt.strftime('%B')  # Full month name
-        df['day_of_week'] = df['date'].dt.strftime('%A')  # Full day name
-        # Convert 'month' to a categorical type for proper ordering
-        month_order = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
-        df['month'] = pd.Categorical(df['month'], month_order, ordered=True)
-        day_order=["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        df['day_of_week'] = pd.Categorical(df['day_of_week'],categories=day_order,ordered=True)
+    if has_rows:
+        # Every chart below is derived from the pre-aggregated cube, built once per dataset
+        def cube_job(job):
+            job.update(0.1, "Building insights cube")
+            with profiler.stage("insights_cube"):
+                return cube_cache.get_or_build(current_data_key(), lambda: load_data(["key", "item", "date", "price", "customer"])[1])
+        # A narrowed date range is answered by the date index, which exposes the same roll-ups as the cube
+        cube = window if window is not None else run_job("insights", cube_job)
+        # Column stores answer distinct counts from their per-month sketches without reading any column
+        distinct = store_distinct_counts(store_dir, start_day, end_day) if has_store and not uploaded_file else None
+        if distinct:
+            st.caption(f"~{distinct['customer']:,} distinct customers and ~{distinct['item']:,} items in the selected months (HyperLogLog estimate)")
         
         st.subheader(":red[1. Sales Trends Over Time]")
         # Aggregate sales by month
-        sales_trend = df.groupby("month")["price"].sum()
+        sales_trend = cube.monthly_revenue()
         # Plotting the sales trend
         fig, ax = plt.subplots(figsize=(4, 3))
         sales_trend.plot(kind="line", ax=ax, color="blue", marker='o',label="Monthly Sales")
@@ -211,19 +390,20 @@ if menu == "Insights":
         with col1:
             ax.set_xlabel("Month", fontsize=6)
             ax.set_ylabel("Total Sales ($)", fontsize=6)
-            ax.set_xticks(range(12))
-            ax.set_xticklabels(month_order, rotation=45, ha='right',fontsize=5)
+            # Label only the months present, which a narrowed date range can reduce
+            ax.set_xticks(range(len(sales_trend)))
+            ax.set_xticklabels(sales_trend.index.astype(str), rotation=45, ha='right',fontsize=5)
             ax.tick_params(axis='y', labelsize=5)
             ax.grid(alpha=0.1)
             ax.legend(fontsize=4)
-            st.pyplot(fig, use_container_width=False)
+            show_pyplot(fig)
         # Auto-generated insight
         with col2:
             st.write(f"**:red[Insight]**: Total sales peaked in :orange[{sales_trend.idxmax()}], with :orange[${sales_trend.max():,.2f}] in revenue. The lowest sales occurred in :orange[{sales_trend.idxmin()}], with :orange[$${sales_trend.min():,.2f}].")
         
         st.subheader(":red[2. Transactions Trends Over Time]")
         # Aggregate sales by month
-        transactions_trend = df.groupby("month")["price"].count()
+        transactions_trend = cube.monthly_transactions()
         col1, col2 = st.columns([4.5,1])
         with col1:
             # Plotting the sales trend
@@ -236,14 +416,14 @@ if menu == "Insights":
             ax.tick_params(axis='y', labelsize=5)
             ax.grid(alpha=0.1)
             ax.legend(fontsize=4)
-            st.pyplot(fig, use_container_width=False)
+            show_pyplot(fig)
         with col2:
         # Auto-generated insight
             st.write(f"**:red[Insight]**: The highest number of transactions occurred in :orange[{transactions_trend.idxmax()}], with :orange[{transactions_trend.max()}] transactions. The lowest occurred in :orange[{transactions_trend.idxmin()}].")
         
         # Transactions by Day of Week
         st.subheader(":red[3. Transactions by Day of Week]")
-        transactions_day_of_week = df.groupby('day_of_week')['price'].count()
+        transactions_day_of_week = cube.weekday_transactions()
         col1, col2 = st.columns([4.5,1])
         with col1:
             fig, ax = plt.subplots(figsize=(4,3))
@@ -253,14 +433,14 @@ if menu == "Insights":
             ax.tick_params(axis='x',labelsize=5,rotation=30)
             ax.tick_params(axis='y',labelsize=5)
             ax.grid(alpha = 0.1)
-            st.pyplot(fig, use_container_width=False)
+            show_pyplot(fig)
         with col2:
         # Auto-generated insight
             st.write(f"**:red[Insight]**: Most transactions occurred on :orange[{transactions_day_of_week.idxmax()}] with :orange[{transactions_day_of_week.max()}] transactions, while the least occurred on :orange[{transactions_day_of_week.idxmin()}].")
 
         # Transactions by Product Category
         st.subheader(":red[4. Transactions by Product Category]")
-        sales_by_product = df.groupby('item')['price'].count().sort_values(ascending=True)
+        sales_by_product = cube.item_transactions().sort_values(ascending=True)
         col1, col2 = st.columns([4.5,1])
         with col1:
             fig, ax = plt.subplots(figsize=(4,3))
@@ -270,13 +450,13 @@ if menu == "Insights":
             ax.tick_params(axis='x',labelsize=5)
             ax.tick_params(axis='y',labelsize=5,rotation = 45)
             ax.grid(alpha = 0.1)
-            st.pyplot(fig, use_container_width=False)   
+            show_pyplot(fig)
         with col2:
         # Auto-generated insight
             st.write(f"**:red[Insight]**: The least popular product is :orange[{sales_by_product.idxmin()}] with only :orange[{sales_by_product.min()}] transactions. The most popular product is :orange[{sales_by_product.idxmax()}] with :orange[{sales_by_product.max()}] transactions.")
 
         st.subheader(":red[5. Top Performing Products]")
-        top_products = df.groupby("item")["price"].sum().sort_values(ascending=False).head(5)
+        top_products = cube.item_revenue().sort_values(ascending=False).head(5)
         col1, col2 = st.columns([4.5,1])
         with col1:
             fig, ax = plt.subplots(figsize=(4,3))
@@ -287,19 +467,19 @@ if menu == "Insights":
             ax.tick_params(axis='x',labelsize=5,rotation = 0)
             ax.tick_params(axis='y',labelsize=5)
             ax.grid(alpha = 0.1)
-            st.pyplot(fig, use_container_width=False)    
+            show_pyplot(fig)
         with col2:
         # Auto-generated insight
             st.write(f"**:red[Insight]**: The top-performing product is :orange[{top_products.idxmax()}] generating :orange[${top_products.max():,.2f}] in revenue.")
 
         # Cumulative Contribution Line Chart
         st.subheader(":red[6. Cumulative Revenue Contribution]")
-        abc_results = abc_analysis(df)
+        abc_results = cube.abc()
         col1, col2 = st.columns([4.5,1.5])
         with col1:
             cumulative_fig = px.line(abc_results.sort_values("price", ascending=False).assign(cumulative=lambda x: x["price"].cumsum()), x="item",
             y="cumulative", labels={"cumulative": "Cumulative Revenue ($)", "item": "Products"})
-            st.plotly_chart(cumulative_fig, use_container_width=True)
+            show_plotly(cumulative_fig)
         # Display cumulative contribution insights
         with col2:
             st.write(f":red[**Insight**]: The top **20% of products** contribute approximately **{abc_results.loc[:int(len(abc_results)*0.2), 'price'].sum() / abc_results['price'].sum():.2%}** of total revenue.")
@@ -313,17 +493,18 @@ if menu == "Insights":
             fig, ax = plt.subplots(figsize=(3,3))
             abc_results["ABC"].value_counts().plot.pie(autopct="%1.1f%%", colors=["green", "orange", "red"], startangle=90, wedgeprops={'alpha':0.7})
             ax.set_ylabel("")  # Remove y-axis label
-            st.pyplot(fig, use_container_width=False)   
+            show_pyplot(fig)
         # Display ABC category insights
         with col2:
-            category_contributions = abc_results.groupby("ABC")["price"].sum() / abc_results["price"].sum()
+            # A narrowed date range may leave a class empty
+            category_contributions = (abc_results.groupby("ABC")["price"].sum() / abc_results["price"].sum()).reindex(["A", "B", "C"], fill_value=0)
             st.write(f"- **Category A** accounts for **{category_contributions['A']:.2%}** of total revenue, representing top-performing products.")
             st.write(f"- **Category B** contributes **{category_contributions['B']:.2%}**, showing medium-performing products.")
             st.write(f"- **Category C** accounts for **{category_contributions['C']:.2%}**, indicating products with low revenue contribution.")
             st.write("=> Consider promoting or phasing out Category C products to improve inventory efficiency.")
             
         st.subheader(":red[8. Customer Retention Metrics]")
-        frm_results = frm_analysis(df)
+        frm_results = cube.frm()
         avg_recency = frm_results["Recency"].mean()
         avg_frequency = frm_results["Frequency"].mean()
         avg_monetary = frm_results["Monetary"].sum()/frm_results["Frequency"].sum()
@@ -335,27 +516,69 @@ if menu == "Insights":
         # Show key metrics by segment
         st.write("##### :blue[Key Metrics by Segment]:")
         frm_results["meanMonetary"] = frm_results["Monetary"]/frm_results["Frequency"]
-        segment_metrics = frm_results.groupby("Segment").agg(
+        segment_metrics = frm_results.groupby("Segment", observed=True).agg(
             AvgRecency=("Recency", "mean"),
             AvgFrequency=("Frequency", "mean"),
             AvgMonetary=("meanMonetary", "mean"),
-            CustomerCount=("Segment", "size"))
+            CustomerCount=("Segment", "size")).reindex(FRM_SEGMENTS).fillna({"CustomerCount": 0}).astype({"CustomerCount": "int64"})
         st.dataframe(segment_metrics)
-        # Display segment-level insights
-        st.write(f"- **High Value Segment**: Customers in this segment spend an average of **${segment_metrics.loc['High Value', 'AvgMonetary']:.2f}** per purchase.")
-        st.write(f"- **Loyal Segment**: These customers purchase **{segment_metrics.loc['Loyal', 'AvgFrequency']:.2f} times** on average but might spend less per transaction.")
-        st.write(f"- **At Risk Segment**: Customers in this segment haven’t purchased in an average of **{segment_metrics.loc['At Risk', 'AvgRecency']:.2f} days**, suggesting the need for retention strategies.")
+        # Display segment-level insights; a narrowed date range may leave a segment empty
+        def segment_insight(segment, text):
+            metrics = segment_metrics.loc[segment]
+            st.write(text(metrics) if metrics["CustomerCount"] else f"- **{segment} Segment**: No customers in the selected date range.")
+        segment_insight("High Value", lambda m: f"- **High Value Segment**: Customers in this segment spend an average of **${m['AvgMonetary']:.2f}** per purchase.")
+        segment_insight("Loyal", lambda m: f"- **Loyal Segment**: These customers purchase **{m['AvgFrequency']:.2f} times** on average but might spend less per transaction.")
+        segment_insight("At Risk", lambda m: f"- **At Risk Segment**: Customers in this segment haven’t purchased in an average of **{m['AvgRecency']:.2f} days**, suggesting the need for retention strategies.")
         st.write("- Focus retention efforts on :green[At Risk] customers and reward :green[Loyal] customers to increase their monetary value.")
 
         # 3D FRM Clustering
         st.subheader(":red[9. 3D FRM Clustering with Segments]")
-        fig = frm_3d_scatter_with_segments(frm_results)
-        st.plotly_chart(fig, use_container_width=True)
+        col1, col2 = st.columns([1, 2])
+        with col1:
+            view = st.radio("3D view", ["Sampled customers", "Customer density"], horizontal=True)
+            color_by = st.radio("Color by", ["Rule segments", "K-means clusters"], horizontal=True)
+        with col2:
+            if view == "Sampled customers":
+                max_points = st.slider("Point budget", 1000, 20000, 5000, step=1000)
+            else:
+                bins = st.slider("Bins per axis", 4, 30, 12)
+        color = "Segment"
+        if color_by == "K-means clusters" and len(frm_results) < FRMClusterModel().n_clusters:
+            st.info("Too few customers in the selected date range to fit clusters; showing rule segments.")
+        elif color_by == "K-means clusters":
+            # Refits warm-start from this dataset's saved centroids (a store's persist as it grows), so repeat
+            # visits converge in a few passes; only full-range fits are saved, and never over another dataset's
+            # or the command-line tool's centroids
+            path = centroids_path(current_data_key() if uploaded_file else f"store-{store_id(store_dir)}")
+            def cluster_job(job):
+                job.update(0.2, "Fitting mini-batch k-means")
+                with profiler.stage("frm_kmeans", rows=len(frm_results)):
+                    model = FRMClusterModel.load(path)
+                    clusters = model.fit_predict(frm_results)
+                    if window is None:
+                        model.save(path)
+                return clusters, model.centroids_frame()
+            period = "all" if window is None else f"{start_day}:{end_day}"
+            clusters, centroids = run_job(f"frm_kmeans:{period}", cluster_job)
+            frm_results = frm_results.assign(Cluster=clusters)
+            color = "Cluster"
+            st.write("Cluster centroids (average customer per cluster)")
+            st.dataframe(centroids.round(2))
+        if view == "Sampled customers":
+            fig = frm_3d_scatter_with_segments(frm_results, max_points=max_points, color=color)
+            if len(frm_results) > max_points:
+                st.caption(f"Showing a stratified sample of {max_points:,} of {len(frm_results):,} customers; each group keeps its share and extremes.")
+        else:
+            fig = frm_3d_scatter_with_segments(frm_results, mode="density", bins=bins, color=color)
+            st.caption("Marker size shows the number of customers in each Recency/Frequency/Monetary cell.")
+        show_plotly(fig)
         # Display clustering insights
         st.write(":blue[**Customer Clustering Analysis**:]")
         st.write("  - Customers are segmented based on their purchasing behavior, offering actionable insights into engagement and marketing strategies.")
         st.write("  - Segments with overlapping behavior can indicate areas where additional data or features might refine segmentation.")
         st.write("- Use the clustering plot to identify standout segments and focus marketing campaigns for the most valuable groups.")
+    elif has_data:
+        st.warning("No transactions in the selected date range; widen it in the sidebar.")
     else:
         st.warning("Please upload a CSV file.")
 # Conclusion Section
@@ -384,3 +607,16 @@ if menu == "Conclusion":
         - Upsell Opportunities: Frequent buyers of low-value items may respond to cross-selling higher-value products.
 
     """)
+
+# Performance panel
+if profiler.enabled:
+    with st.sidebar.expander(":stopwatch: Performance", expanded=False):
+        this_run = profiler.to_frame(profiler.run)
+        st.write(f"This rerun: **{this_run['seconds'].sum():.3f}s** across {len(this_run)} stages")
+        st.dataframe(this_run.drop(columns=["run", "started_at"]), hide_index=True)
+        st.write("Session totals")
+        st.dataframe(profiler.summary())
+        st.download_button("Download JSON", profiler.to_json(), file_name="performance.json", mime="application/json")
+        st.download_button("Download CSV", profiler.to_csv(), file_name="performance.csv", mime="text/csv")
+        if st.button("Clear recordings"):
+            profiler.clear()
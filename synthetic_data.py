@@ -0,0 +1,68 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+MENU = ["Latte", "Cappuccino", "Espresso", "Coffee", "Mocha", "Tea", "Cake", "Sandwich", "Cookie", "Muffin",
+        "Americano", "Macchiato", "Flat White", "Hot Chocolate", "Croissant", "Bagel"]
+
+# Item names with Zipf popularity weights (a few products carry most of the revenue) and base prices
+def make_catalog(n_items, skew=1.2, seed=0):
+    rng = np.random.default_rng(seed)
+    names = MENU[:n_items] + [f"Item-{i:03d}" for i in range(len(MENU), n_items)]
+    popularity = 1.0 / np.arange(1, n_items + 1) ** skew
+    return pd.DataFrame({
+        "item": names,
+        "weight": popularity / popularity.sum(),
+        "base_price": rng.uniform(3, 20, n_items).round(2),})
+
+# Pareto-distributed purchase propensity per customer, so a minority of customers buy most often
+def make_customer_weights(n_customers, shape=1.5, seed=0):
+    rng = np.random.default_rng(seed + 1)
+    activity = rng.pareto(shape, n_customers) + 1
+    return activity / activity.sum()
+
+# Yield DataFrames of synthetic transactions in the key,item,date,price,customer schema
+def iter_transactions(n_rows, n_items=16, n_customers=None, start="2024-01-01", days=365, chunk_rows=1_000_000, seed=0):
+    n_customers = n_customers or max(100, n_rows // 20)
+    catalog = make_catalog(n_items, seed=seed)
+    item_cdf = np.cumsum(catalog["weight"].to_numpy())
+    customer_cdf = np.cumsum(make_customer_weights(n_customers, seed=seed))
+    item_names = catalog["item"].to_numpy(dtype=object)
+    base_prices = catalog["base_price"].to_numpy()
+    customer_width = len(str(n_customers))
+    key_width = max(3, len(str(n_rows)))
+    start = np.datetime64(start, "D")
+    rng = np.random.default_rng(seed + 2)
+    for offset in range(0, n_rows, chunk_rows):
+        size = min(chunk_rows, n_rows - offset)
+        items = np.minimum(np.searchsorted(item_cdf, rng.random(size)), n_items - 1)
+        customers = np.minimum(np.searchsorted(customer_cdf, rng.random(size)), n_customers - 1) + 1
+        keys = np.arange(offset + 1, offset + size + 1)
+        yield pd.DataFrame({
+            "key": np.char.add("ORD-", np.char.zfill(keys.astype(str), key_width)),
+            "item": item_names[items],
+            "date": (start + rng.integers(0, days, size)).astype(str),
+            "price": (base_prices[items] * rng.uniform(0.9, 1.1, size)).round(2),
+            "customer": np.char.add("CUST-", np.char.zfill(customers.astype(str), customer_width)),})
+
+def generate_transactions(n_rows, **kwargs):
+    return pd.concat(iter_transactions(n_rows, **kwargs), ignore_index=True)
+
+# Stream a synthetic dataset to CSV without holding it in memory
+def write_transactions_csv(path, n_rows, **kwargs):
+    for number, chunk in enumerate(iter_transactions(n_rows, **kwargs)):
+        chunk.to_csv(path, mode="w" if number == 0 else "a", header=number == 0, index=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic coffee shop transactions CSV.")
+    parser.add_argument("path", help="CSV file to write")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--items", type=int, default=16)
+    parser.add_argument("--customers", type=int, help="Distinct customers (default: rows / 20)")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_transactions_csv(args.path, args.rows, n_items=args.items, n_customers=args.customers, days=args.days, seed=args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import os
+import pandas as pd
+import pandas.testing as tm
+import pytest
+from analysis_tools import abc_analysis, frm_analysis
+from chunked_analysis import abc_analysis_chunked, frm_analysis_chunked
+
+SAMPLE_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "coffee_point_data.csv")
+
+# Chunked results must match the in-memory analysis on the whole file, whatever the chunk size
+@pytest.fixture(scope="module")
+def sample():
+    return pd.read_csv(SAMPLE_CSV)
+
+@pytest.mark.parametrize("chunksize", [97, 1000, 1_000_000])
+def test_chunked_abc_matches_in_memory(sample, chunksize):
+    expected = abc_analysis(sample)
+    result = abc_analysis_chunked(SAMPLE_CSV, chunksize)
+    tm.assert_series_equal(result["item"].astype(object), expected["item"].astype(object), check_names=False)
+    tm.assert_series_equal(result["price"], expected["price"], check_exact=False, rtol=1e-9)
+    tm.assert_series_equal(result["ABC"], expected["ABC"])
+
+@pytest.mark.parametrize("chunksize", [97, 1000, 1_000_000])
+def test_chunked_frm_matches_in_memory(sample, chunksize):
+    expected = frm_analysis(sample)
+    result = frm_analysis_chunked(SAMPLE_CSV, chunksize)
+    assert list(result.index.astype(object)) == list(expected.index.astype(object))
+    tm.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True), check_exact=False, rtol=1e-9)
+
+# Customer partitions are disjoint, combine to the whole-file aggregates, and their merged sketches stay within the rank error
+def test_partition_sketches_merge_within_rank_error(sample):
+    from chunked_analysis import PartialAggregates, aggregate_csv_partitioned
+    from sketches import partition_thresholds
+    parts = aggregate_csv_partitioned(SAMPLE_CSV, 1000, partitions=4)
+    assert sum(len(part.customers) for part in parts) == sample["customer"].nunique()
+    expected = frm_analysis(sample)
+    result = PartialAggregates.combine(parts).frm()
+    tm.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True), check_exact=False, rtol=1e-9)
+    current_date = max(part.last_date for part in parts) + pd.Timedelta(days=1)
+    thresholds = partition_thresholds((part.frm(current_date) for part in parts), quantile_error=0.05)
+    for axis, threshold in thresholds.items():
+        rank = (expected[axis] <= threshold).mean()
+        assert abs(rank - 0.5) <= 0.05 + 1 / len(expected)
@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+import ingest
+from ingest import IngestError, ingest_csv, record_lines, rejected_rows
+
+HEADER = b"key,item,date,price,customer\n"
+
+def problems(report):
+    return list(report[["line", "column", "reason"]].itertuples(index=False, name=None))
+
+# Run every case with and without pyarrow, which take different read paths
+@pytest.fixture(params=["pyarrow", "pandas"], autouse=True)
+def reader(request, monkeypatch):
+    if request.param == "pandas":
+        monkeypatch.setattr(ingest, "pa", None)
+    elif ingest.pa is None:
+        pytest.skip("pyarrow is not installed")
+    return request.param
+
+def test_missing_columns_are_refused():
+    with pytest.raises(IngestError, match="price, customer"):
+        ingest_csv(b"key,item,date\nA1,Latte,2024-01-01\n")
+
+def test_bad_dates_and_prices_are_rejected_with_their_lines():
+    clean, report = ingest_csv(HEADER + b"A1,Latte,2024-01-01,3.5,c1\nA2,Latte,01/02/2024,3.5,c1\nA3,Mocha,2024-01-03,abc,c2\nA4,Mocha,2024-01-04,-1,c2\n")
+    assert list(clean["key"]) == ["A1"]
+    assert problems(report) == [(3, "date", "not a %Y-%m-%d date"), (4, "price", "not a number"), (5, "price", "negative price")]
+    assert rejected_rows(report) == 3
+
+def test_duplicate_keys_are_dropped_or_kept():
+    data = HEADER + b"A1,Latte,2024-01-01,3.5,c1\nA1,Mocha,2024-01-02,4.0,c2\n"
+    clean, report = ingest_csv(data)
+    assert list(clean["item"]) == ["Latte"]
+    assert problems(report) == [(3, "key", "duplicate key")]
+    clean, report = ingest_csv(data, duplicates="keep")
+    assert len(clean) == 2 and list(report["action"]) == ["kept"]
+
+def test_rows_with_the_wrong_number_of_fields(reader):
+    data = HEADER + b"A1,Latte,2024-01-01,3.5,c1\nA2,Latte,2024-01-02,3.5,c1,extra\nA3,Mocha,2024-01-03,4.0,c2\n"
+    clean, report = ingest_csv(data)
+    if reader == "pandas":
+        # pandas drops trailing fields beyond the selected columns
+        assert list(clean["key"]) == ["A1", "A2", "A3"] and report.empty
+        return
+    assert list(clean["key"]) == ["A1", "A3"]
+    assert problems(report) == [(3, None, "6 fields instead of 5")]
+
+def test_unterminated_quote(reader):
+    data = HEADER + b'A1,Latte,2024-01-01,3.5,c1\nA2,"Latte,2024-01-02,3.5,c1\nA3,Mocha,2024-01-03,4.0,c2\n'
+    if reader == "pandas":
+        with pytest.raises(IngestError, match="Could not parse"):
+            ingest_csv(data)
+        return
+    clean, report = ingest_csv(data)
+    assert list(clean["key"]) == ["A1"]
+    assert problems(report) == [(3, None, "2 fields instead of 5")]
+
+def test_line_numbers_follow_blank_lines_and_quoted_line_breaks():
+    data = HEADER + b'A1,Latte,2024-01-01,3.5,c1\n\nA2,"Flat\nwhite",2024-01-02,3.5,c1\r\nA3,Mocha,bad,4.0,c2\n'
+    assert list(record_lines(data)) == [1, 2, 4, 6]
+    clean, report = ingest_csv(data)
+    assert list(clean["item"].astype(str)) == ["Latte", "Flat\nwhite"]
+    assert problems(report) == [(6, "date", "not a %Y-%m-%d date")]
+
+@pytest.mark.parametrize("data", [HEADER, HEADER + b"A1,Latte,not-a-date,3.5,c1\n"])
+def test_files_without_valid_rows_are_refused(data):
+    with pytest.raises(IngestError, match="No valid rows"):
+        ingest_csv(data)
+
+def test_clean_file_matches_pandas(tmp_path):
+    path = tmp_path / "clean.csv"
+    path.write_bytes(HEADER + b"A1,Latte,2024-01-01,3.5,c1\nA2,Mocha,2024-01-02,4.0,c2\n")
+    clean, report = ingest_csv(str(path))
+    expected = pd.read_csv(path, parse_dates=["date"])
+    assert list(clean["key"]) == list(expected["key"]) and list(clean["price"]) == list(expected["price"])
+    assert report.empty
@@ -0,0 +1,82 @@
+import os
+import pandas as pd
+import pandas.testing as tm
+import pytest
+from analysis_tools import abc_analysis, frm_analysis
+from compact_table import CompactTable, LabelDictionary
+from windowed import DateIndex
+
+SAMPLE_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "coffee_point_data.csv")
+WINDOWS = [("2024-01-01", "2024-12-31"), ("2024-03-01", "2024-04-15"), ("2024-05-05", "2024-05-05"), ("2024-11-20", "2024-12-31")]
+
+# Windowed results must match the in-memory analysis on the rows inside the window
+@pytest.fixture(scope="module")
+def sample():
+    df = pd.read_csv(SAMPLE_CSV)
+    df["date"] = pd.to_datetime(df["date"])
+    return df
+
+# Index over the frame itself or over its compact table
+@pytest.fixture(scope="module", params=["frame", "compact"])
+def indexed(request, sample):
+    if request.param == "frame":
+        return DateIndex.from_frame(sample), sample
+    dictionaries = {name: LabelDictionary(name) for name in ["item", "customer"]}
+    return DateIndex.from_frame(CompactTable.from_frame(sample, dictionaries)), sample
+
+def rows_between(df, start, end):
+    return df[df["date"].between(start, end)]
+
+@pytest.mark.parametrize("start,end", WINDOWS)
+def test_window_abc_matches_in_memory(indexed, start, end):
+    index, rows = indexed
+    expected = abc_analysis(rows_between(rows, start, end))
+    result = index.window(start, end).abc()
+    assert list(result["item"].astype(object)) == list(expected["item"].astype(object))
+    tm.assert_series_equal(result["price"], expected["price"], check_exact=False, rtol=1e-9)
+    tm.assert_series_equal(result["ABC"], expected["ABC"])
+
+@pytest.mark.parametrize("start,end", WINDOWS)
+def test_window_frm_matches_in_memory(indexed, start, end):
+    index, rows = indexed
+    expected = frm_analysis(rows_between(rows, start, end))
+    result = index.window(start, end).frm()
+    assert list(result.index.astype(object)) == list(expected.index.astype(object))
+    tm.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True), check_exact=False, rtol=1e-9)
+
+def test_empty_window_has_no_transactions(indexed):
+    window = indexed[0].window("2023-01-01", "2023-12-31")
+    assert len(window) == 0
+
+# Column stores answer a window from the month partitions overlapping it
+@pytest.mark.parametrize("start,end", WINDOWS[1:])
+def test_store_window_matches_in_memory(sample, tmp_path, start, end):
+    from column_store import convert_csv, read_store
+    convert_csv(SAMPLE_CSV, str(tmp_path), chunksize=2000)
+    frame = read_store(str(tmp_path), ["item", "date", "price", "customer"], start, end)
+    window = DateIndex.from_frame(frame).window(start, end)
+    expected = frm_analysis(rows_between(sample, start, end))
+    result = window.frm()
+    assert list(result.index.astype(object)) == list(expected.index.astype(object))
+    tm.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True), check_exact=False, rtol=1e-9)
+    tm.assert_series_equal(window.abc()["ABC"], abc_analysis(rows_between(sample, start, end))["ABC"])
+
+# A store's key follows its contents, so caches never serve a re-converted store's old data
+def test_store_key_changes_with_contents(sample, tmp_path):
+    from column_store import convert_csv, store_key
+    changed = tmp_path / "changed.csv"
+    sample.assign(price=sample["price"] * 2).to_csv(changed, index=False, date_format="%Y-%m-%d")
+    convert_csv(SAMPLE_CSV, str(tmp_path / "store"))
+    original = store_key(str(tmp_path / "store"))
+    convert_csv(str(changed), str(tmp_path / "store"))
+    assert store_key(str(tmp_path / "store")) != original
+    convert_csv(SAMPLE_CSV, str(tmp_path / "store"))
+    assert store_key(str(tmp_path / "store")) == original
+
+# Compact tables keep whole-cent prices exact, so shown and exported values match the CSV
+def test_compact_prices_match_csv(sample):
+    dictionaries = {name: LabelDictionary(name) for name in ["item", "customer"]}
+    table = CompactTable.from_frame(sample, dictionaries)
+    assert table.to_frame()["price"].tolist() == sample["price"].tolist()
+    expected = sample.groupby("item")["price"].sum().round(2)
+    assert abc_analysis(table).set_index("item")["price"].sort_index().tolist() == expected.sort_index().tolist()
@@ -0,0 +1,150 @@
+import os
+import numpy as np
+import pandas as pd
+from analysis_tools import classify_abc, frm_from_aggregates
+from byte_lru import ByteLRU
+from compact_table import EPOCH, CompactTable
+from dataset_cache import DAY_ORDER, MONTH_ORDER
+
+# Date-sorted index answering ABC, trend and FRM questions for any [start, end] window with
+# binary search and prefix-sum differences instead of re-scanning the transactions.
+#  - items: per-day x per-item revenue and transaction counts, stored as prefix sums over days
+#  - customers: transactions sorted by (customer, day) with a running price total, so one
+#    searchsorted per customer bounds its purchases inside the window
+class DateIndex:
+    def __init__(self, item, customer, day, price, item_labels, customer_labels):
+        self.item_labels = np.asarray(item_labels, dtype=object)
+        self.customer_labels = np.asarray(customer_labels, dtype=object)
+        self.days = np.unique(day)
+        price = price.astype("float64")
+        n_days, n_items = len(self.days), len(self.item_labels)
+
+        cells = np.searchsorted(self.days, day) * n_items + item
+        revenue = np.bincount(cells, weights=price, minlength=n_days * n_items).reshape(n_days, n_items)
+        counts = np.bincount(cells, minlength=n_days * n_items).reshape(n_days, n_items)
+        self.item_revenue_prefix = np.vstack([np.zeros(n_items), revenue.cumsum(axis=0)])
+        self.item_count_prefix = np.vstack([np.zeros(n_items, dtype="int64"), counts.cumsum(axis=0)])
+        self.daily_revenue = revenue.sum(axis=1)
+        self.daily_count = counts.sum(axis=1)
+
+        # Day offsets fit in the low 32 bits of a combined (customer, day) sort key
+        self.first_day = int(self.days[0]) if n_days else 0
+        order = np.lexsort((day, customer))
+        self.customer_keys = (customer[order].astype("int64") << 32) | (day[order].astype("int64") - self.first_day)
+        # Whole-cent prices are summed as integer cents so prefix differences are exact at any length
+        cents = np.round(price * 100)
+        self.price_scale = 100 if np.array_equal(cents / 100, price) else 1
+        scaled = cents.astype("int64") if self.price_scale == 100 else price
+        self.customer_price_prefix = np.concatenate([[0], scaled[order].cumsum()])
+        # Customers present in the data; searches run in code order (cache friendly) and
+        # label_order rearranges the results into the label order frm_analysis produces
+        self.customer_codes = np.unique(customer)
+        self.label_order = np.argsort(self.customer_labels[self.customer_codes], kind="stable")
+        self.sorted_customer_labels = self.customer_labels[self.customer_codes[self.label_order]]
+
+    @classmethod
+    def from_table(cls, table):
+        return cls(table.item, table.customer, table.day, table.prices(),
+                   table.labels("item"), table.labels("customer"))
+
+    @classmethod
+    def from_frame(cls, df):
+        if isinstance(df, CompactTable):
+            return cls.from_table(df)
+        item, item_labels = pd.factorize(df["item"])
+        customer, customer_labels = pd.factorize(df["customer"])
+        day = (pd.to_datetime(df["date"]).to_numpy(dtype="datetime64[D]") - EPOCH).astype("int32")
+        return cls(item, customer, day, df["price"].to_numpy(), item_labels, customer_labels)
+
+    @property
+    def date_range(self):
+        return pd.Timestamp(EPOCH + self.days[0]), pd.Timestamp(EPOCH + self.days[-1])
+
+    @property
+    def nbytes(self):
+        arrays = [self.item_labels, self.customer_labels, self.days, self.item_revenue_prefix, self.item_count_prefix, self.daily_revenue, self.daily_count,
+                  self.customer_keys, self.customer_price_prefix, self.customer_codes, self.label_order, self.sorted_customer_labels]
+        return sum(array.nbytes for array in arrays)
+
+    def window(self, start=None, end=None):
+        start = self.days[0] if start is None else (np.datetime64(pd.Timestamp(start).date(), "D") - EPOCH).astype("int64")
+        end = self.days[-1] if end is None else (np.datetime64(pd.Timestamp(end).date(), "D") - EPOCH).astype("int64")
+        return WindowView(self, int(start), int(end))
+
+# Aggregates for one [start, end] window, exposing the same roll-ups as the Insights cube
+class WindowView:
+    def __init__(self, index, start, end):
+        self.index = index
+        self.start = start
+        self.end = end
+        self._lo = np.searchsorted(index.days, start, side="left")
+        self._hi = np.searchsorted(index.days, end, side="right")
+
+    # Transactions inside the window
+    def __len__(self):
+        return int(self.index.daily_count[self._lo:self._hi].sum())
+
+    def _items(self, prefix):
+        values = self.index.item_count_prefix if prefix == "count" else self.index.item_revenue_prefix
+        return values[self._hi] - values[self._lo]
+
+    def _observed_items(self, values):
+        observed = np.flatnonzero(self._items("count"))
+        labels = self.index.item_labels[observed]
+        order = np.argsort(labels, kind="stable")
+        return pd.Series(values[observed][order], index=pd.Index(labels[order], name="item"))
+
+    def item_revenue(self):
+        return self._observed_items(self._items("revenue")).rename("price")
+
+    def item_transactions(self):
+        return self._observed_items(self._items("count")).rename("price")
+
+    def _daily(self, name):
+        values = self.index.daily_revenue if name == "revenue" else self.index.daily_count
+        dates = pd.DatetimeIndex((EPOCH + self.index.days[self._lo:self._hi]).astype("datetime64[ns]"))
+        return pd.Series(values[self._lo:self._hi], index=dates)
+
+    def _by_calendar(self, name, codes, labels):
+        daily = self._daily(name)
+        calendar = pd.Categorical.from_codes(codes(daily.index), labels, ordered=True)
+        return daily.groupby(calendar, observed=True).sum()
+
+    def monthly_revenue(self):
+        return self._by_calendar("revenue", lambda dates: dates.month - 1, MONTH_ORDER).rename_axis("month")
+
+    def monthly_transactions(self):
+        return self._by_calendar("count", lambda dates: dates.month - 1, MONTH_ORDER).rename_axis("month")
+
+    def weekday_transactions(self):
+        return self._by_calendar("count", lambda dates: dates.dayofweek, DAY_ORDER).rename_axis("day_of_week")
+
+    # Frequency, LastDate and Monetary per customer inside the window, sorted by customer label
+    def customer_aggregates(self):
+        index = self.index
+        base = index.customer_codes.astype("int64") << 32
+        lo = np.searchsorted(index.customer_keys, base | max(self.start - index.first_day, 0), side="left")[index.label_order]
+        hi = np.searchsorted(index.customer_keys, base | max(self.end - index.first_day, 0), side="right")[index.label_order]
+        frequency = hi - lo if self.end >= index.first_day else np.zeros_like(lo)
+        active = frequency > 0
+        lo, hi = lo[active], hi[active]
+        last_day = (index.customer_keys[hi - 1] & 0xFFFFFFFF) + index.first_day
+        return pd.DataFrame({
+            "Frequency": frequency[active],
+            "LastDate": (EPOCH + last_day).astype("datetime64[ns]"),
+            "Monetary": (index.customer_price_prefix[hi] - index.customer_price_prefix[lo]) / index.price_scale,},
+            index=pd.Index(index.sorted_customer_labels[active], name="customer"))
+
+    def abc(self):
+        return classify_abc(self.item_revenue())
+
+    def frm(self):
+        return frm_from_aggregates(self.customer_aggregates())
+
+# Process-wide date indexes keyed by dataset hash, bounded by their size (the days x items prefix
+# matrices grow with both the date span and the catalogue)
+class IndexCache(ByteLRU):
+    def get_or_build(self, key, load_frame):
+        return self.get_or_compute(key, lambda: DateIndex.from_frame(load_frame()))
+
+index_cache = IndexCache(max_bytes=int(os.environ.get("COFFEEPOINT_INDEX_CACHE_MB", "512")) * 1024 * 1024)